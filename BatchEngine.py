@@ -0,0 +1,117 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+
+"""
+Many independent boards of the same shape stepped together.
+
+The boards are stacked into one (boards, rows, cols) array and every step is a single SandEngine.find_moves /
+apply_moves over the whole stack, so the cost of the Python interpreter is paid once per step and not once
+per board. A board which did not change in a step is settled (the grains only go down, so it cannot change
+again); it is stored in the results and removed from the stack, so the following steps work only on the
+boards still moving.
+"""
+
+import numpy as np
+
+from SandEngine import SAND, find_moves, apply_moves
+
+
+class SandBatch:
+    """
+    Stack of independent boards stepped with one vectorized step.
+
+    Attributes:
+        boards          (boards, rows, cols) uint8 array with the state of every board, the settled ones are
+                        final, the moving ones are updated by sync()
+        steps           number of steps in which every board changed
+        grains_moved    number of grain moves of every board
+        settled         True for the boards which stopped changing
+        active          indexes of the boards still moving, in the order of the rows of work
+        work            stack of the boards still moving
+    """
+
+    def __init__(self, boards):
+        self.boards = np.array(boards, dtype=np.uint8)
+        if self.boards.ndim != 3:
+            raise ValueError(f'expected a stack of 2D boards, got an array of shape {self.boards.shape}')
+        count = self.boards.shape[0]
+        self.steps = np.zeros(count, dtype=np.int64)
+        self.grains_moved = np.zeros(count, dtype=np.int64)
+        self.settled = np.zeros(count, dtype=bool)
+        self.active = np.arange(count)
+        self.work = np.copy(self.boards)
+
+    @classmethod
+    def from_board(cls, board, count, fill=None):
+        """Creates count copies of board, fill(index, board) may change every copy in place (e.g. add sand)."""
+        boards = np.repeat(np.asarray(board, dtype=np.uint8)[np.newaxis], count, axis=0)
+        if fill is not None:
+            for index in range(count):
+                fill(index, boards[index])
+        return cls(boards)
+
+    def __len__(self):
+        return self.boards.shape[0]
+
+    @property
+    def finished(self):
+        return len(self.active) == 0
+
+    def step(self):
+        """Advances every moving board by one step, returns the number of boards still moving."""
+        if self.finished:
+            return 0
+        fall, left, right = find_moves(self.work)
+        moving = fall | left | right
+        moved = np.count_nonzero(moving.reshape(len(self.active), -1), axis=1)
+        apply_moves(self.work, fall, left, right, moving)
+        changed = moved > 0
+        self.steps[self.active[changed]] += 1
+        self.grains_moved[self.active] += moved
+        if not changed.all():
+            done = ~changed
+            self.boards[self.active[done]] = self.work[done]
+            self.settled[self.active[done]] = True
+            self.active = self.active[changed]
+            self.work = self.work[changed]
+        return len(self.active)
+
+    def run(self, max_steps=None):
+        """Steps until every board settles or max_steps steps were made, returns the number of steps made."""
+        made = 0
+        while not self.finished and (max_steps is None or made < max_steps):
+            self.step()
+            made += 1
+        self.sync()
+        return made
+
+    def sync(self):
+        """Copies the current state of the moving boards into boards."""
+        self.boards[self.active] = self.work
+
+    def count_sand(self):
+        """Number of grains of every board."""
+        self.sync()
+        return np.count_nonzero(self.boards.reshape(len(self), -1) == SAND, axis=1)
@@ -0,0 +1,98 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Checkpoints of a running simulation.
+
+A checkpoint is a compressed .npz file with the map, the step counter, the sand generator, the cycle detection
+state and optionally the history (see SandModel.get_checkpoint). Files are written to a temporary file in the
+same directory which then replaces the checkpoint, so an interrupted write never damages the previous one.
+
+    writer = CheckpointWriter('run.ckpt.npz', every=1000)
+    writer.attach(model)
+    ...
+    load_checkpoint(model, 'run.ckpt.npz')  # after a restart
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from SandModel import STEP
+
+
+def save_checkpoint(model, path, history=False):
+    """Writes the checkpoint of the model atomically."""
+    checkpoint = model.get_checkpoint(history)
+    directory = os.path.dirname(os.path.abspath(path))
+    file = tempfile.NamedTemporaryFile(dir=directory, prefix='.checkpoint-', suffix='.tmp', delete=False)
+    try:
+        with file:
+            np.savez_compressed(file, **checkpoint)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+
+def load_checkpoint(model, path):
+    """Restores the model from the checkpoint file."""
+    with np.load(path) as checkpoint:
+        model.set_checkpoint({key: checkpoint[key] for key in checkpoint.files})
+
+
+class CheckpointWriter:
+    """
+    Writes a checkpoint of the model every given number of calculated steps.
+
+    Attributes:
+        path        path of the checkpoint file, overwritten by every checkpoint
+        every       number of steps between two checkpoints
+        history     bool indicating if the history is included in the checkpoints
+        steps       number of steps since the last checkpoint
+    """
+
+    def __init__(self, path, every, history=False):
+        self.path = path
+        self.every = max(1, every)
+        self.history = history
+        self.steps = 0
+        self.models = []
+
+    def attach(self, model):
+        model.subscribe(STEP, self.on_step)
+        self.models.append(model)
+
+    def detach(self, model):
+        model.unsubscribe(STEP, self.on_step)
+        self.models.remove(model)
+
+    def on_step(self, model):
+        self.steps += 1
+        if self.steps >= self.every:
+            self.steps = 0
+            save_checkpoint(model, self.path, self.history)
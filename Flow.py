@@ -0,0 +1,141 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+
+"""
+Persistent sources and drains of sand applied after every step of the simulation.
+
+An emitter puts grains into the empty cells of its region in every step, all of them or, with a rate below 1,
+each one with that probability. The random mask of a step depends only on the seed of the emitter and the step
+number, so the flow is reproduced exactly by replays and continued checkpoints. A sink removes the grains
+which reached its region. Both work with whole-region array operations and return the flat indexes of the
+cells they changed, which is all the model needs to update the history, the board hash and the active chunks.
+"""
+
+import numpy as np
+
+from SandEngine import SAND, EMPTY
+
+
+def region_slices(region, shape):
+    """Slices of the region (row_start, row_stop, col_start, col_stop) clipped to the map shape."""
+    row_start, row_stop, col_start, col_stop = region
+    rows, cols = shape
+    return (slice(min(max(row_start, 0), rows), min(max(row_stop, 0), rows)),
+            slice(min(max(col_start, 0), cols), min(max(col_stop, 0), cols)))
+
+
+def flat_indexes(mask, slices, cols):
+    """Flat indexes in the map of the cells set in the mask of the region."""
+    rows, columns = np.nonzero(mask)
+    return (rows + slices[0].start) * cols + columns + slices[1].start
+
+
+class Emitter:
+    """
+    Region in which sand appears in every step.
+
+    Attributes:
+        region      (row_start, row_stop, col_start, col_stop) of the cells
+        rate        probability that an empty cell of the region gets a grain in a step, 1 fills all of them
+        seed        seed of the random mask, used only when rate < 1
+    """
+
+    def __init__(self, region, rate=1.0, seed=None):
+        if not 0 < rate <= 1:
+            raise ValueError(f'rate has to be in (0, 1], got {rate}')
+        self.region = tuple(int(value) for value in region)
+        self.rate = float(rate)
+        self.seed = seed
+
+    @property
+    def random(self):
+        return self.rate < 1
+
+    def apply(self, grid, step):
+        """Puts the grains of the step into grid (in place).
+
+        :return: tuple (flat indexes of the new grains, bool indicating if empty cells are left in the region).
+        """
+        slices = region_slices(self.region, grid.shape)
+        view = grid[slices]
+        empty = view == EMPTY
+        if self.random:
+            mask = empty & (np.random.default_rng([self.seed, step]).random(view.shape) < self.rate)
+        else:
+            mask = empty
+        view[mask] = SAND
+        return flat_indexes(mask, slices, grid.shape[1]), bool(np.count_nonzero(empty) > np.count_nonzero(mask))
+
+    def to_dict(self):
+        return {'type': 'emitter', 'region': list(self.region), 'rate': self.rate, 'seed': self.seed}
+
+
+class Sink:
+    """
+    Region in which the grains disappear.
+
+    Attributes:
+        region      (row_start, row_stop, col_start, col_stop) of the cells
+    """
+
+    def __init__(self, region):
+        self.region = tuple(int(value) for value in region)
+
+    def apply(self, grid):
+        """Removes the grains of the region from grid (in place), returns their flat indexes."""
+        slices = region_slices(self.region, grid.shape)
+        view = grid[slices]
+        mask = view == SAND
+        view[mask] = EMPTY
+        return flat_indexes(mask, slices, grid.shape[1])
+
+    def to_dict(self):
+        return {'type': 'sink', 'region': list(self.region)}
+
+
+def from_dict(description):
+    """Emitter or Sink described by to_dict."""
+    if description['type'] == 'emitter':
+        return Emitter(description['region'], description['rate'], description['seed'])
+    if description['type'] == 'sink':
+        return Sink(description['region'])
+    raise ValueError(f"Unknown flow element '{description['type']}'")
+
+
+def apply_flow(grid, emitters, sinks, step):
+    """Applies the sinks and then the emitters to grid (in place).
+
+    :param step: number of the step, selects the random masks of the emitters.
+    :return: tuple (flat indexes of the removed grains, flat indexes of the added grains, bool indicating if an
+        emitter has empty cells left, i.e. the map may still change when nothing moves).
+    """
+    removed = [np.empty(0, dtype=np.intp)] + [sink.apply(grid) for sink in sinks]
+    added = [np.empty(0, dtype=np.intp)]
+    pending = False
+    for emitter in emitters:
+        cells, left = emitter.apply(grid, step)
+        added.append(cells)
+        pending = pending or left
+    return np.concatenate(removed), np.concatenate(added), pending
@@ -0,0 +1,248 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Streaming export of the simulation frames.
+
+An exporter subscribes to the STEP event of a SandModel (see attach) and passes copies of the frames through
+a bounded queue to a background thread, which encodes them as they arrive. Only the frames waiting in the
+queue (and one chunk of the NPZ exporter) are kept in memory, so runs of any length can be recorded.
+
+Recording throttles the simulation to the speed of the writer: when the queue is full the stepping thread waits.
+It does not wait inside the STEP event, where it holds the lock of the model, but at the STEP_UNLOCKED event
+emitted by SimulationWorker after releasing it. Without that event (e.g. headless.py) the waiting is done in
+the STEP event once another queue of frames is collected.
+
+    exporter = GifExporter('run.gif', every=5)
+    exporter.attach(model)
+    ...  # step the model
+    exporter.close()
+"""
+
+import os
+import queue
+import threading
+import zipfile
+from collections import deque
+
+import numpy as np
+from PIL import GifImagePlugin, Image
+
+from SandModel import STEP, STEP_UNLOCKED
+from settings import EXPORT_QUEUE_SIZE
+
+
+class FrameExporter:
+    """
+    Base class of the exporters: bounded queue of frames and a background writer thread.
+
+    Subclasses implement consume(frames), which receives a generator of the frames and returns when it ends.
+
+    Attributes:
+        path        path of the output (file or directory)
+        every       only every n-th produced frame is exported
+        frames      queue of the frames waiting for the writer
+        pending     copies of the frames taken in the STEP event, waiting for a place in frames (see drain)
+        written     number of frames encoded so far
+        error       exception raised by the writer thread, re-raised by close
+    """
+
+    def __init__(self, path, every=1, queue_size=EXPORT_QUEUE_SIZE):
+        self.path = path
+        self.every = max(1, every)
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.pending = deque()
+        self.drain_lock = threading.Lock()
+        self.produced = 0
+        self.written = 0
+        self.error = None
+        self.models = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def attach(self, model):
+        """Exports the current state of the model and every state it calculates from now on."""
+        with model.lock:
+            model.subscribe(STEP, self.on_step)
+            model.subscribe(STEP_UNLOCKED, self.drain)
+            self.models.append(model)
+            self.collect(model.map)
+        self.drain()
+
+    def detach(self, model):
+        model.unsubscribe(STEP, self.on_step)
+        model.unsubscribe(STEP_UNLOCKED, self.drain)
+        self.models.remove(model)
+
+    def on_step(self, model):
+        # called with the lock of the model held, the frame is only copied here
+        self.collect(model.map)
+        self.drain(block=len(self.pending) > self.frames.maxsize)
+
+    def write(self, frame):
+        """Queues a copy of the frame, waits when the queue is full so that no frame is lost."""
+        self.collect(frame)
+        self.drain()
+
+    def collect(self, frame):
+        """Takes a copy of the frame (if it is due) without waiting for the writer."""
+        if self.produced % self.every == 0:
+            self.pending.append(np.copy(frame))
+        self.produced += 1
+
+    def drain(self, block=True):
+        """Moves the collected frames into the queue of the writer.
+
+        :param block: wait when the queue is full, otherwise the remaining frames stay collected.
+        """
+        if not self.drain_lock.acquire(blocking=block):
+            return
+        try:
+            while self.pending:
+                try:
+                    self.frames.put(self.pending[0], block=block)
+                except queue.Full:
+                    return
+                self.pending.popleft()
+        finally:
+            self.drain_lock.release()
+
+    def frame_stream(self):
+        """Generator of the queued frames, ends at the end marker put by close."""
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                return
+            yield frame
+            self.written += 1
+
+    def run(self):
+        """Main method of the writer thread."""
+        try:
+            self.consume(self.frame_stream())
+        except Exception as error:
+            self.error = error
+            # keep taking the frames, the producer must not wait forever
+            for _ in self.frame_stream():
+                pass
+
+    def consume(self, frames):
+        raise NotImplementedError
+
+    def close(self):
+        """Stops exporting, waits until all the queued frames are written."""
+        for model in list(self.models):
+            self.detach(model)
+        self.drain()
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class ImageSequenceExporter(FrameExporter):
+    """Writes every frame as an image file (PNG by default) into the directory path."""
+
+    def __init__(self, path, name_format='frame_{:06d}.png', **kwargs):
+        self.name_format = name_format
+        os.makedirs(path, exist_ok=True)
+        super().__init__(path, **kwargs)
+
+    def consume(self, frames):
+        for number, frame in enumerate(frames):
+            Image.fromarray(frame, 'L').save(os.path.join(self.path, self.name_format.format(number)))
+
+
+class GifExporter(FrameExporter):
+    """Writes an animated GIF frame by frame, duration is the time of one frame in ms."""
+
+    def __init__(self, path, duration=50, loop=0, **kwargs):
+        self.duration = duration
+        self.loop = loop
+        super().__init__(path, **kwargs)
+
+    def consume(self, frames):
+        with open(self.path, 'wb') as file:
+            for number, frame in enumerate(frames):
+                image = Image.fromarray(frame, 'L')
+                if number == 0:
+                    header, _ = GifImagePlugin.getheader(image, info={'loop': self.loop, 'duration': self.duration})
+                    file.writelines(header)
+                file.writelines(GifImagePlugin.getdata(image, duration=self.duration))
+            file.write(b';')  # GIF trailer
+
+
+class NpzExporter(FrameExporter):
+    """
+    Writes the frames into a compressed .npz archive in chunks of chunk_frames frames.
+
+    Every chunk is a 3D array (frames, rows, cols) named frames_000000, frames_000001, ... (see read_npz_frames).
+    """
+
+    def __init__(self, path, chunk_frames=64, **kwargs):
+        self.chunk_frames = chunk_frames
+        super().__init__(path, **kwargs)
+
+    def consume(self, frames):
+        with zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            chunk = None
+            count = 0
+            number = 0
+            for frame in frames:
+                if chunk is None or chunk.shape[1:] != frame.shape:
+                    if count:
+                        self.write_chunk(archive, number, chunk[:count])
+                        number += 1
+                    chunk = np.empty((self.chunk_frames,) + frame.shape, dtype=frame.dtype)
+                    count = 0
+                chunk[count] = frame
+                count += 1
+                if count == self.chunk_frames:
+                    self.write_chunk(archive, number, chunk)
+                    number += 1
+                    count = 0
+            if count:
+                self.write_chunk(archive, number, chunk[:count])
+
+    @staticmethod
+    def write_chunk(archive, number, frames):
+        with archive.open(f'frames_{number:06d}.npy', 'w', force_zip64=True) as file:
+            np.lib.format.write_array(file, np.ascontiguousarray(frames))
+
+
+def read_npz_frames(path):
+    """Generator of the frames written by NpzExporter, one chunk is loaded at a time."""
+    with np.load(path) as archive:
+        for name in sorted(archive.files):
+            yield from archive[name]
+
+
+def exporter_for(path, **kwargs):
+    """Creates the exporter for the path: .gif, .npz or a directory for an image sequence."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.gif':
+        return GifExporter(path, **kwargs)
+    if extension == '.npz':
+        return NpzExporter(path, **kwargs)
+    return ImageSequenceExporter(path, **kwargs)
@@ -0,0 +1,325 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+
+"""
+Streaming of the simulation frames to other processes over a local TCP or Unix socket.
+
+A FrameServer subscribes to the STEP event of a SandModel and runs an asyncio server in a background thread.
+The model only hands over a copy of the frame, so the simulation never waits for the clients. Every client
+first gets a keyframe with the whole map and then deltas: the runs of the cells changed since the last frame
+it received, with their new values, compressed with zlib. A slow client is held back by the socket
+(StreamWriter.drain) and gets only the newest frame when it is ready again, the frames in between are skipped.
+
+    server = FrameServer('127.0.0.1:8765').start()
+    server.attach(model)
+    ...  # step the model
+    server.close()
+
+    python FrameStream.py 127.0.0.1:8765 --export run.gif   # watch or record from another process
+
+Messages are a 4-byte little-endian length followed by the zlib compressed body: kind (b'K' keyframe or b'D'
+delta), step (int64), rows and cols (uint32), then the map bytes (keyframe) or the number of runs (uint32),
+the run starts and lengths (uint32, flat indexes) and the values of the changed cells (delta).
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from FrameExporter import exporter_for
+from SandEngine import SAND
+from SandModel import STEP
+from settings import STREAM_CLOSE_TIMEOUT
+
+KEYFRAME = b'K'
+DELTA = b'D'
+HEADER = struct.Struct('<cqII')
+LENGTH = struct.Struct('<I')
+
+
+def parse_address(address):
+    """(host, port) of 'host:port' (':port' means localhost), otherwise the path of a Unix socket."""
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit():
+        return host or '127.0.0.1', int(port)
+    return address
+
+
+def encode_frame(step, frame, previous=None):
+    """Message with the frame, a delta from previous when it is given, of the same shape and smaller."""
+    rows, cols = frame.shape
+    body = None
+    if previous is not None and previous.shape == frame.shape:
+        changed = (previous != frame).ravel()
+        padded = np.concatenate(([False], changed, [False]))
+        edges = np.flatnonzero(padded[1:] != padded[:-1])
+        starts, stops = edges[::2], edges[1::2]
+        if starts.size * 8 < frame.size:
+            body = b''.join((HEADER.pack(DELTA, step, rows, cols), LENGTH.pack(starts.size),
+                             starts.astype('<u4').tobytes(), (stops - starts).astype('<u4').tobytes(),
+                             frame.ravel()[changed].tobytes()))
+    if body is None:
+        body = HEADER.pack(KEYFRAME, step, rows, cols) + np.ascontiguousarray(frame).tobytes()
+    data = zlib.compress(body, 1)
+    return LENGTH.pack(len(data)) + data
+
+
+class FrameDecoder:
+    """
+    Reconstructs the frames from the message bodies (without the length).
+
+    Attributes:
+        frame       the last decoded frame, None before the first keyframe
+        step        step of the last decoded frame
+    """
+
+    def __init__(self):
+        self.frame = None
+        self.step = None
+
+    def decode(self, data):
+        """Returns (step, frame) of the message, the frame is a new array."""
+        body = zlib.decompress(data)
+        kind, step, rows, cols = HEADER.unpack_from(body)
+        offset = HEADER.size
+        if kind == KEYFRAME:
+            frame = np.frombuffer(body, dtype=np.uint8, count=rows * cols, offset=offset).reshape(rows, cols).copy()
+        elif kind == DELTA:
+            if self.frame is None or self.frame.shape != (rows, cols):
+                raise ValueError('delta without the keyframe it is based on')
+            runs, = LENGTH.unpack_from(body, offset)
+            offset += LENGTH.size
+            starts = np.frombuffer(body, dtype='<u4', count=runs, offset=offset).astype(np.intp)
+            lengths = np.frombuffer(body, dtype='<u4', count=runs, offset=offset + 4 * runs).astype(np.intp)
+            values = np.frombuffer(body, dtype=np.uint8, offset=offset + 8 * runs)
+            # flat indexes of the cells of all the runs: every run continues from its start
+            indexes = np.arange(values.size) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+            frame = self.frame.copy()
+            frame.ravel()[indexes] = values
+        else:
+            raise ValueError(f'unknown message kind {kind!r}')
+        self.frame, self.step = frame, step
+        return step, frame
+
+
+class FrameServer:
+    """
+    Asyncio server streaming the newest frame of the model to all connected clients.
+
+    Attributes:
+        address     'host:port' or the path of the Unix socket, see parse_address
+        every       only every n-th step is published
+        latest      (step, frame) of the newest published frame, the frame is not modified afterwards
+        clients     asyncio.Event of every connected client, set when a newer frame is published
+        sent        number of messages sent to all clients
+    """
+
+    def __init__(self, address, every=1):
+        self.address = address
+        self.every = max(1, every)
+        self.latest = None
+        self.clients = set()
+        self.tasks = set()
+        self.sent = 0
+        self.produced = 0
+        self.closing = False
+        self.models = []
+        self.server = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def start(self):
+        """Starts the event loop thread and opens the socket, returns self."""
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe(self.open(), self.loop).result()
+        return self
+
+    async def open(self):
+        address = parse_address(self.address)
+        if isinstance(address, tuple):
+            return await asyncio.start_server(self.serve_client, *address)
+        return await asyncio.start_unix_server(self.serve_client, address)
+
+    @property
+    def bound_address(self):
+        """Address the server listens on, with the port chosen by the system when 0 was given."""
+        name = self.server.sockets[0].getsockname()
+        return f'{name[0]}:{name[1]}' if isinstance(name, tuple) else name
+
+    def attach(self, model):
+        """Publishes the current state of the model and every state it calculates from now on."""
+        model.subscribe(STEP, self.on_step)
+        self.models.append(model)
+        self.write(model.map, model.steps)
+
+    def detach(self, model):
+        model.unsubscribe(STEP, self.on_step)
+        self.models.remove(model)
+
+    def on_step(self, model):
+        self.produced += 1
+        if self.produced % self.every == 0:
+            self.write(model.map, model.steps)
+
+    def write(self, frame, step):
+        """Publishes a copy of the frame, never waits for the clients."""
+        self.loop.call_soon_threadsafe(self.publish, int(step), np.copy(frame))
+
+    def publish(self, step, frame):
+        self.latest = step, frame
+        for event in self.clients:
+            event.set()
+
+    async def serve_client(self, reader, writer):
+        """Sends the newest frame whenever the client took the previous one."""
+        event = asyncio.Event()
+        self.clients.add(event)
+        self.tasks.add(asyncio.current_task())
+        if self.latest is not None:
+            event.set()
+        previous = None
+        try:
+            while True:
+                if not self.closing:
+                    await event.wait()
+                    event.clear()
+                if self.latest is not None and self.latest[1] is not previous:
+                    step, frame = self.latest
+                    writer.write(encode_frame(step, frame, previous))
+                    await writer.drain()
+                    self.sent += 1
+                    previous = frame
+                elif self.closing:
+                    # a newer frame may have been published while the previous one was drained
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(event)
+            self.tasks.discard(asyncio.current_task())
+            writer.close()
+            try:
+                # the data still buffered by the transport is sent before the loop is stopped
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def shutdown(self):
+        self.server.close()
+        self.closing = True
+        for event in self.clients:
+            event.set()
+        # the clients get the last frame unless they do not take it in time
+        tasks = list(self.tasks)
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=STREAM_CLOSE_TIMEOUT)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def close(self):
+        """Stops publishing, sends the newest frame to the clients and closes the server."""
+        for model in list(self.models):
+            self.detach(model)
+        if self.server is not None:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+            if not isinstance(parse_address(self.address), tuple) and os.path.exists(self.address):
+                os.remove(self.address)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread.is_alive():
+            self.thread.join()
+        self.loop.close()
+
+
+class FrameClient:
+    """Blocking client of a FrameServer, frames() yields the reconstructed frames."""
+
+    def __init__(self, address, timeout=None):
+        address = parse_address(address)
+        family = socket.AF_INET if isinstance(address, tuple) else socket.AF_UNIX
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self.decoder = FrameDecoder()
+
+    def receive(self, size):
+        """Exactly size bytes, None when the server closed the connection."""
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.socket.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return bytes(data)
+
+    def frames(self):
+        """Generator of (step, frame) until the server closes the connection."""
+        while True:
+            length = self.receive(LENGTH.size)
+            data = self.receive(LENGTH.unpack(length)[0]) if length is not None else None
+            if data is None:
+                return
+            yield self.decoder.decode(data)
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Receive the frames streamed by headless.py --serve.')
+    parser.add_argument('address', help="'host:port' or the path of the Unix socket")
+    parser.add_argument('--export', help='records the frames: .gif, .npz or a directory for a PNG sequence')
+    parser.add_argument('--frames', type=int, help='stop after this number of frames')
+    args = parser.parse_args(argv)
+    received = 0
+    with FrameClient(args.address) as client:
+        exporter = exporter_for(args.export) if args.export else None
+        for step, frame in client.frames():
+            received += 1
+            print(f'step {step}: {np.count_nonzero(frame == SAND)} grains', file=sys.stderr)
+            if exporter is not None:
+                exporter.write(frame)
+            if args.frames is not None and received >= args.frames:
+                break
+    if exporter is not None:
+        exporter.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
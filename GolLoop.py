@@ -21,7 +21,9 @@
 ## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 ## SOFTWARE.
 ##
+from timeit import default_timer as timer
 from PyQt5.QtCore import QTimer
+from Instrumentation import STATS
 
 
 class GolLoop(QTimer):
@@ -31,32 +33,51 @@ class GolLoop(QTimer):
     Attributes:
         going   bool value representing the state of the game
         currentTimer    value of time between GoL steps in ms
+        worker  optional SimulationWorker stepping the model on its own thread
+        startedAt   time the timer was last started, the delay of the timeout is recorded as display_lag_ms
 
     Fires timeout signal every currentTimer ms. Game of Life and View controllers are connected to this signal.
+    When a worker is given the model is stepped by the worker, the timeout signal only refreshes the view
+    (every display_period ms) and the speed controls the worker.
     """
 
-    def __init__(self):
+    def __init__(self, worker=None, display_period=16):
         super().__init__()
         self.going = False
-        self.currentTimer = 100
+        self.worker = worker
+        self.startedAt = None
+        self.currentTimer = display_period if worker is not None else 100
         self.timeout.connect(self.loop)
         self.setSingleShot(True)  # so that the timer timeout fires only once when started
 
     def loop(self):
         """Main method: called at each timeout and if the game is playing restarts the timer with currentTimer value"""
+        if self.startedAt is not None:
+            # time the timeout waited for the event loop
+            STATS.record('display_lag_ms', (timer() - self.startedAt) * 1000 - self.interval())
+            self.startedAt = None
         if self.going and self.isSingleShot() and self.currentTimer > 0:
             self.start(self.currentTimer)
+            self.startedAt = timer()
 
     def set_speed(self, speed):
-        """Setter for currentTimer(speed)"""
-        self.currentTimer = speed
+        """Setter for currentTimer(speed), with a worker sets the time between steps of the worker instead"""
+        if self.worker is not None:
+            self.worker.set_steps_per_second(1000 / speed if speed > 0 else 0)
+        else:
+            self.currentTimer = speed
 
     def play_pause(self):
         """Toggle between play(going) and pause(!going) modes"""
         self.stop()
         self.going = not self.going
         if self.going is True:
+            if self.worker is not None:
+                self.worker.resume()
             self.start(self.currentTimer)
+            self.startedAt = timer()
+        elif self.worker is not None:
+            self.worker.pause()
 
     def is_going(self):
         """Getter for the state of the game"""
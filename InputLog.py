@@ -0,0 +1,91 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Log of the edits of a simulation, from which the simulation can be reproduced exactly (see Replay.py).
+
+The log holds the map the simulation started from and the edits made to it (generators, brush strokes, set
+cells, settle, emitters and sinks), each with the number of the simulation step it was made at and the time
+since the start. A simulation is deterministic, so the log is all that is needed to calculate any of its states.
+"""
+
+import json
+import time
+
+import numpy as np
+
+# methods of SandModel which change the map outside of the rules and are recorded in the log
+LOGGED_ACTIONS = ('topEdgeGenerator', 'centralEdgeGenerator', 'set_cell', 'begin_stroke', 'stroke_to',
+                  'end_stroke', 'settle', 'add_emitter', 'add_sink', 'clear_flow')
+
+
+class InputLog:
+    """
+    Initial map and the list of the edit events.
+
+    Attributes:
+        initial     copy of the map the log starts from
+        name        name of the pattern of the initial map (may be None)
+        first_step  step counter of the model when the log was started
+        events      list of dictionaries {'step', 'time', 'action', 'args'}, in the order of the edits
+        end_step    step counter of the model when the log was saved, None if not known
+    """
+
+    def __init__(self, initial, name=None, first_step=0):
+        self.initial = np.copy(initial)
+        self.name = name
+        self.first_step = first_step
+        self.events = []
+        self.end_step = None
+        self.started = time.monotonic()
+
+    def record(self, step, action, **args):
+        if action not in LOGGED_ACTIONS:
+            raise ValueError(f"Action '{action}' cannot be recorded")
+        self.events.append({'step': int(step), 'time': round(time.monotonic() - self.started, 3),
+                            'action': action, 'args': args})
+
+    @property
+    def last_step(self):
+        """Step of the last edit, the first step when there is no edit."""
+        return self.events[-1]['step'] if self.events else self.first_step
+
+    def save(self, path):
+        """Writes the log as a compressed .npz file: the initial map and the events as JSON."""
+        with open(path, 'wb') as file:
+            np.savez_compressed(file, initial=self.initial, name=np.array(self.name or ''),
+                                first_step=np.int64(self.first_step),
+                                end_step=np.int64(-1 if self.end_step is None else self.end_step),
+                                events=np.array(json.dumps(self.events)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            log = cls(data['initial'], str(data['name']) or None, int(data['first_step']))
+            log.events = json.loads(str(data['events']))
+            log.end_step = int(data['end_step']) if data['end_step'] >= 0 else None
+        for event in log.events:
+            if event['action'] not in LOGGED_ACTIONS:
+                raise ValueError(f"Unknown action '{event['action']}' in {path}")
+        return log
@@ -0,0 +1,184 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Timers, counters and an opt-in profiler for the hot paths of the simulation and the view.
+
+Methods are measured with the timed decorator, which records their latency in the STATS registry. The same
+registry keeps rates of events (steps and frames per second), values per event (grains moved per step) and
+gauges (history memory). STATS.snapshot() returns everything as a dictionary, e.g. for a JSON dump:
+
+    @timed('step')
+    def calculate_next_state(self):
+        ...
+
+    print(json.dumps(STATS.snapshot(), indent=2))
+"""
+
+import cProfile
+import threading
+from collections import deque
+from functools import wraps
+from timeit import default_timer as timer
+
+import numpy as np
+
+from settings import STATS_WINDOW, STATS_ENABLED
+
+
+class Stats:
+    """
+    Registry of the measurements, the last window values of every kind are kept.
+
+    Attributes:
+        enabled     bool, when False nothing is recorded
+        latencies   deque of durations in seconds by stage name
+        ticks       deque of event times by event name, used for the rates
+        values      deque of recorded values by name
+        gauges      last set value by name
+        profile     pending or running cProfile capture, see profile_next
+    """
+
+    def __init__(self, window, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.profile = None
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.latencies = {}
+            self.ticks = {}
+            self.values = {}
+            self.gauges = {}
+
+    def series(self, kind, name):
+        return kind.setdefault(name, deque(maxlen=self.window))
+
+    def record_latency(self, stage, seconds):
+        with self.lock:
+            self.series(self.latencies, stage).append(seconds)
+
+    def tick(self, event):
+        """Records an occurrence of the event for its rate."""
+        if self.enabled:
+            with self.lock:
+                self.series(self.ticks, event).append(timer())
+
+    def record(self, name, value):
+        if self.enabled:
+            with self.lock:
+                self.series(self.values, name).append(value)
+
+    def set_gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        """All the measurements as a dictionary of plain values."""
+        with self.lock:
+            latencies = {name: np.array(values) for name, values in self.latencies.items() if values}
+            ticks = {name: list(times) for name, times in self.ticks.items() if times}
+            values = {name: np.array(series) for name, series in self.values.items() if series}
+            gauges = dict(self.gauges)
+        now = timer()
+        rates = {}
+        for name, times in ticks.items():
+            # the rate is measured over the window, it drops to 0 when the events stop
+            span = now - times[0]
+            rates[name + '_per_second'] = (len(times) - 1) / span if len(times) > 1 and span > 0 else 0.0
+        return {
+            'rates': rates,
+            'latency_ms': {name: {
+                'count': int(durations.size),
+                'mean': float(durations.mean() * 1000),
+                'p50': float(np.percentile(durations, 50) * 1000),
+                'p90': float(np.percentile(durations, 90) * 1000),
+                'p99': float(np.percentile(durations, 99) * 1000),
+                'max': float(durations.max() * 1000),
+            } for name, durations in latencies.items()},
+            'values': {name: {'last': float(series[-1]), 'mean': float(series.mean()), 'max': float(series.max())}
+                       for name, series in values.items()},
+            'gauges': gauges,
+        }
+
+    def profile_next(self, calls, path):
+        """Captures a cProfile profile of the next calls of the method decorated with profiled into path (.prof)."""
+        self.profile = {'calls': calls, 'path': path, 'profiler': None}
+
+
+STATS = Stats(STATS_WINDOW, STATS_ENABLED)
+
+
+def format_stats(snapshot):
+    """Short text report of a snapshot, one measurement per line."""
+    lines = [f"{name.replace('_', ' ')}: {rate:.1f}" for name, rate in snapshot['rates'].items()]
+    lines += [f"{name}: p50 {stage['p50']:.2f} ms, p90 {stage['p90']:.2f} ms, p99 {stage['p99']:.2f} ms"
+              for name, stage in snapshot['latency_ms'].items()]
+    lines += [f"{name.replace('_', ' ')}: {series['last']:.1f} (mean {series['mean']:.1f})"
+              for name, series in snapshot['values'].items()]
+    if 'history_bytes' in snapshot['gauges']:
+        lines.append(f"history: {snapshot['gauges']['history_states']} states, "
+                     f"{snapshot['gauges']['history_bytes'] / 2 ** 20:.1f} MB")
+    return '\n'.join(lines)
+
+
+def timed(stage):
+    """Decorator recording the latency of every call of the method as the stage."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            if not STATS.enabled:
+                return method(*args, **kwargs)
+            start = timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                STATS.record_latency(stage, timer() - start)
+        return wrapper
+    return decorator
+
+
+def profiled(method):
+    """Decorator running the method under cProfile while a capture requested with STATS.profile_next lasts.
+
+    The profiler is started on the thread calling the method, so it measures the thread stepping the model.
+    The statistics are written after every call, so the file is complete even when fewer calls happen.
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        profile = STATS.profile
+        if profile is None:
+            return method(*args, **kwargs)
+        if profile['profiler'] is None:
+            profile['profiler'] = cProfile.Profile()
+        try:
+            return profile['profiler'].runcall(method, *args, **kwargs)
+        finally:
+            profile['calls'] -= 1
+            profile['profiler'].dump_stats(profile['path'])
+            if profile['calls'] <= 0:
+                STATS.profile = None
+    return wrapper
@@ -24,12 +24,18 @@
 
 
 import PyQt5
-from PyQt5.QtCore import (Qt, pyqtSlot)
+from PyQt5.QtCore import (Qt, pyqtSlot, QTimer)
 
 from PyQt5.QtWidgets import (QSlider, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, QMessageBox,
-                             QCheckBox)
+                             QCheckBox, QSpinBox, QProgressDialog, QApplication)
+from Checkpoint import load_checkpoint, save_checkpoint
+from FrameExporter import exporter_for
+from InputLog import InputLog
+from Instrumentation import STATS, format_stats
 from MapViewer import MapViewer
-from MyWidgets import PatternMenu, PlayPauseButton, SandGenerateMethodMenu
+from MyWidgets import MaterialMenu, PatternMenu, PlayPauseButton, SandGenerateMethodMenu
+from Replay import Replayer
+from settings import STATS_OVERLAY_PERIOD, PROFILE_STEPS, REPLAY_GUI_STEPS
 
 
 class MainWindow(QWidget):
@@ -39,6 +45,8 @@ class MainWindow(QWidget):
         model         reference to an object of class GameOfLife (the model)
         loop        reference to an object of class GolLoop (the main loop of the game)
         viewer      custom widget to show the Game of Life model
+        exporter    FrameExporter recording the produced frames while the record check box is checked
+        overlay     label over the viewer showing the performance statistics while the stats check box is checked
         ...some graphical elements
     """
 
@@ -47,6 +55,7 @@ class MainWindow(QWidget):
 
         self.model = model
         self.loop = loop
+        self.exporter = None
         self.init_ui()
 
     def init_ui(self):
@@ -55,7 +64,8 @@ class MainWindow(QWidget):
         self.viewer = MapViewer()
         self.viewer.resize(800, 600)
         self.viewer.set_model(self.model)
-        self.loop.timeout.connect(self.viewer.updateView)
+        self.viewer.set_worker(self.loop.worker)
+        self.loop.timeout.connect(self.viewer.refreshView)
 
         self.play_pause_button = PlayPauseButton()
 
@@ -79,10 +89,47 @@ class MainWindow(QWidget):
         self.generate_sand_button = QPushButton("Generate")
         self.generate_sand_button.clicked.connect(self.generate_clicked)
 
+        self.brush = QSpinBox()
+        self.brush.setRange(0, 50)
+        self.brush.setValue(self.viewer.brush_radius)
+        self.brush.valueChanged.connect(self.brush_changed)
+
+        self.paint = MaterialMenu()
+        self.paint.currentIndexChanged.connect(self.paint_changed)
+
         self.nextStep = QPushButton()
         self.nextStep.setText("Next Step")
         self.nextStep.clicked.connect(self.next_clicked)
 
+        self.skipToEnd = QPushButton()
+        self.skipToEnd.setText("Skip to end")
+        self.skipToEnd.clicked.connect(self.skip_to_end_clicked)
+
+        self.saveState = QPushButton("Save state")
+        self.saveState.clicked.connect(self.save_state_clicked)
+        self.loadState = QPushButton("Load state")
+        self.loadState.clicked.connect(self.load_state_clicked)
+
+        self.saveReplay = QPushButton("Save replay")
+        self.saveReplay.clicked.connect(self.save_replay_clicked)
+        self.loadReplay = QPushButton("Load replay")
+        self.loadReplay.clicked.connect(self.load_replay_clicked)
+
+        self.record = QCheckBox("Record")
+        self.record.toggled.connect(self.record_toggled)
+
+        self.stats = QCheckBox("Stats")
+        self.stats.toggled.connect(self.stats_toggled)
+        self.overlay = QLabel(self.viewer)
+        self.overlay.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; font-family: monospace;"
+                                   "padding: 4px")
+        self.overlay.hide()
+        self.overlayTimer = QTimer()
+        self.overlayTimer.timeout.connect(self.update_overlay)
+
+        self.profile = QPushButton("Profile")
+        self.profile.clicked.connect(self.profile_clicked)
+
         self.prevStep = QPushButton()
         self.prevStep.setText("Previous Step")
         self.prevStep.clicked.connect(self.prev_clicked)
@@ -94,6 +141,14 @@ class MainWindow(QWidget):
         top_h_box.addWidget(self.menu_sand_label)
         top_h_box.addWidget(self.menu_sand)
         top_h_box.addWidget(self.generate_sand_button)
+        top_h_box.addWidget(QLabel('Brush '))
+        top_h_box.addWidget(self.brush)
+        top_h_box.addWidget(QLabel('Paint '))
+        top_h_box.addWidget(self.paint)
+        top_h_box.addWidget(self.saveState)
+        top_h_box.addWidget(self.loadState)
+        top_h_box.addWidget(self.saveReplay)
+        top_h_box.addWidget(self.loadReplay)
 
         bottom_h_box = QHBoxLayout()
         bottom_h_box.addWidget(self.play_pause_button)
@@ -105,6 +160,10 @@ class MainWindow(QWidget):
 
         bottom_h_box.addWidget(self.prevStep)
         bottom_h_box.addWidget(self.nextStep)
+        bottom_h_box.addWidget(self.skipToEnd)
+        bottom_h_box.addWidget(self.record)
+        bottom_h_box.addWidget(self.stats)
+        bottom_h_box.addWidget(self.profile)
 
         v_box = QVBoxLayout()
         v_box.addLayout(top_h_box)
@@ -134,6 +193,14 @@ class MainWindow(QWidget):
         self.model.next()
         self.viewer.updateView()
 
+    def skip_to_end_clicked(self):
+        """Slot for the skip to end button click event. Pauses the loop and calculates the settled state at once"""
+        if self.loop.is_going():
+            self.loop.play_pause()
+            self.play_pause_button.changeText()
+        self.model.settle()
+        self.viewer.updateView()
+
     def prev_clicked(self):
         view = self.model.prev()
         self.viewer.updateView(view)
@@ -153,8 +220,113 @@ class MainWindow(QWidget):
     def slider_changed(self):
         """Slot for the speed slider value changed signal. Changes the loop timeout time based on the speed"""
         speed = 1010 - self.slider.value()
+        if self.loop.worker is not None and self.slider.value() == self.slider.maximum():
+            speed = 0  # the worker steps as fast as possible
         self.loop.set_speed(speed)
 
+    def brush_changed(self, radius):
+        """Slot for the brush spin box value changed signal. Changes the radius of the painting brush"""
+        self.viewer.brush_radius = radius
+
+    def paint_changed(self, index):
+        """Slot for the paint combo box index changed signal. Changes the material painted with the left button"""
+        self.viewer.paint_value = self.paint.itemData(index)
+
+    def save_state_clicked(self):
+        """Slot for the save state button click event. Writes a checkpoint with the history into the chosen file"""
+        path, _ = QFileDialog.getSaveFileName(self, "Save state", "checkpoint.npz", "Checkpoint (*.npz)")
+        if path:
+            save_checkpoint(self.model, path, history=True)
+
+    def load_state_clicked(self):
+        """Slot for the load state button click event. Pauses the loop and restores the chosen checkpoint"""
+        path, _ = QFileDialog.getOpenFileName(self, "Load state", "", "Checkpoint (*.npz)")
+        if not path:
+            return
+        if self.loop.is_going():
+            self.loop.play_pause()
+            self.play_pause_button.changeText()
+        try:
+            load_checkpoint(self.model, path)
+        except Exception:
+            QMessageBox.about(self, "File Error", "File selected is not a valid checkpoint")
+        self.viewer.updateView()
+
+    def save_replay_clicked(self):
+        """Slot for the save replay button click event. Writes the initial map and the edits into the chosen file"""
+        path, _ = QFileDialog.getSaveFileName(self, "Save replay", "session.replay.npz", "Replay (*.npz)")
+        if path:
+            self.model.save_replay(path)
+
+    def load_replay_clicked(self):
+        """Slot for the load replay button click event. Pauses the loop and reproduces the chosen replay.
+
+        The replay is calculated REPLAY_GUI_STEPS steps at a time with the model locked (the worker may still be
+        finishing its step), the window stays responsive between them and the replay can be cancelled"""
+        path, _ = QFileDialog.getOpenFileName(self, "Load replay", "", "Replay (*.npz)")
+        if not path:
+            return
+        if self.loop.is_going():
+            self.loop.play_pause()
+            self.play_pause_button.changeText()
+        progress = QProgressDialog("Replaying...", "Cancel", 0, 0, self)
+        progress.setWindowModality(Qt.WindowModal)
+        try:
+            with self.model.lock:
+                replayer = Replayer(InputLog.load(path), model=self.model.core)
+            progress.show()
+            done = False
+            while not done and not progress.wasCanceled():
+                with self.model.lock:
+                    done = replayer.advance(REPLAY_GUI_STEPS)
+                self.viewer.updateView()
+                QApplication.processEvents()
+        except Exception:
+            QMessageBox.about(self, "File Error", "File selected is not a valid replay")
+        finally:
+            progress.close()
+        self.viewer.updateView()
+
+    def record_toggled(self, checked):
+        """Slot for the record check box. Starts recording the frames into the chosen file or stops the recording"""
+        if not checked:
+            if self.exporter is not None:
+                self.exporter.close()
+                self.exporter = None
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Record to", "recording.gif",
+                                              "Animated GIF (*.gif);;Compressed frames (*.npz);;PNG sequence (*)")
+        if not path:
+            self.record.setChecked(False)
+            return
+        self.exporter = exporter_for(path)
+        self.exporter.attach(self.model)
+
+    def stats_toggled(self, checked):
+        """Slot for the stats check box. Shows or hides the overlay with the performance statistics"""
+        if checked:
+            self.update_overlay()
+            self.overlay.show()
+            self.overlayTimer.start(STATS_OVERLAY_PERIOD)
+        else:
+            self.overlayTimer.stop()
+            self.overlay.hide()
+
+    def update_overlay(self):
+        self.overlay.setText(format_stats(STATS.snapshot()))
+        self.overlay.adjustSize()
+
+    def profile_clicked(self):
+        """Slot for the profile button click event. Profiles the next PROFILE_STEPS steps into the chosen file"""
+        path, _ = QFileDialog.getSaveFileName(self, "Save profile", "steps.prof", "cProfile stats (*.prof)")
+        if path:
+            STATS.profile_next(PROFILE_STEPS, path)
+
+    def closeEvent(self, ev):
+        """Slot for window close event (Override): finishes the recording"""
+        self.record.setChecked(False)
+        super().closeEvent(ev)
+
     def resizeEvent(self, ev):
         """Slot for window resize event (Override)"""
         # self.viewer.updateView()
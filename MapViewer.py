@@ -22,9 +22,17 @@
 ## SOFTWARE.
 ##
 from timeit import default_timer as timer
-from PyQt5.QtCore import (Qt)
-from PyQt5.QtGui import QImage, qRgb, QPixmap
+import numpy as np
+from PyQt5.QtCore import (Qt, QRect)
+from PyQt5.QtGui import QImage, qRgb, QPainter
 from PyQt5.QtWidgets import (QLabel, QSizePolicy)
+from settings import BRUSH_RADIUS, ZOOM_STEP, MIN_VISIBLE_CELLS
+from SandEngine import EMPTY, WALL, downsample
+from Materials import colour_table
+from Instrumentation import STATS, timed
+
+# colours of the cell values, see Materials.colour_table
+COLOR_TABLE = [qRgb(*colour) for colour in colour_table()]
 
 
 class MapViewer(QLabel):
@@ -34,12 +42,21 @@ class MapViewer(QLabel):
     Attributes:
         model         reference to an object of class GameOfLife (the model)
         drawing     bool value to keep track of mouse button long press and movement
+        brush_radius    radius of the brush in cells used for painting strokes
+        paint_value     cell value painted with the left button (empty cells or a material), walls use the right one
         V_margin    dimension of right and left margin in window (widget) coordinates for the image
         H_margin    dimension of top and bottom margin in window (widget) coordinates for the image
         h           board (model state) height
         w           board (model state) height
         lastUpdate  time of the last view update
-        pixmap      image representing the state of the game (QPixmap object) (self.pixmap())
+        zoom        1 shows the whole board, zoom 2 a half of its width and height, ...
+        center      (row, col) of the board shown in the middle of the view, None means the board center
+        view        (region, factor) of the shown part of the board: region is (row_start, row_stop, col_start,
+                    col_stop) and every pixel of the image shows factor x factor cells (see SandEngine.downsample)
+        panning     last mouse position while the view is dragged with the middle button, None otherwise
+        image       persistent Indexed8 QImage of the shown part, painted scaled into target_rect
+        buffer      numpy view of the image memory, frames are copied into it
+        target_rect widget rectangle the image is painted in, recalculated only when the view changes
     """
 
     def __init__(self):
@@ -52,6 +69,22 @@ class MapViewer(QLabel):
         self.h = 0
         self.w = 0
         self.lastUpdate = timer()
+        self.worker = None
+        self.image = None
+        self.buffer = None
+        self.target_rect = QRect()
+        self.brush_radius = BRUSH_RADIUS
+        self.paint_value = EMPTY
+        self.zoom = 1.0
+        self.center = None
+        self.view = None
+        self.panning = None
+
+    def set_worker(self, worker):
+        """Set the reference to the SimulationWorker producing frames for refreshView."""
+        self.worker = worker
+        if worker is not None:
+            worker.view = self.view
 
     def set_model(self, model):
         """
@@ -63,23 +96,166 @@ class MapViewer(QLabel):
         self.model = model
         self.updateView()  # update the view to show the first frame
 
+    def refreshView(self):
+        """Slot for the display timer: shows the newest frame produced by the worker, older frames are dropped"""
+        if self.worker is None:
+            self.updateView()
+            STATS.tick('frames')
+            return
+        produced = self.worker.latest_frame()
+        if produced is not None:
+            view, frame = produced
+            if view == self.view:
+                self.showFrame(frame)
+            else:
+                self.updateView()  # the frame was made before the view was zoomed, moved or resized
+            STATS.tick('frames')
+
+    @timed('view_update')
     def updateView(self, view=None):
-        """Update the view converting the current state (np.ndarray) to an image (QPixmap) and showing it on screen"""
-        map = self.model.get_state() if not view else view
-        self.h = map.shape[0]
-        self.w = map.shape[1]
-        qim = self.toQImage(map)  # first convert to QImage
-        qpix = QPixmap.fromImage(qim)  # then convert to QPixmap
-        # set the pixmap and resize to fit the widget dimension
-        self.setPixmap(qpix.scaled(self.size(), Qt.KeepAspectRatio, Qt.FastTransformation))
+        """Update the view with the shown part of the current state or of the given board (np.ndarray),
+        repainting only the changed part"""
+        if view is None:
+            if self.model.map.shape != (self.h, self.w):
+                self.set_board_size(self.model.map.shape)
+            frame = self.model.get_view(*self.view)
+        else:
+            if view.shape != (self.h, self.w):
+                self.set_board_size(view.shape)
+            (row_start, row_stop, col_start, col_stop), factor = self.view
+            frame = downsample(view[row_start:row_stop, col_start:col_stop], factor)
+        self.showFrame(frame)
+
+    def showFrame(self, frame):
+        """Copies the frame (the shown part of the board) into the image and repaints the changed part"""
+        if self.buffer is None or self.buffer.shape != frame.shape:
+            self.set_image_size(frame.shape)
+            np.copyto(self.buffer, frame)
+            self.update()
+        else:
+            changed = self.buffer != frame
+            changed_rows = np.flatnonzero(changed.any(axis=1))
+            if changed_rows.size:
+                changed_cols = np.flatnonzero(changed.any(axis=0))
+                rows = slice(changed_rows[0], changed_rows[-1] + 1)
+                cols = slice(changed_cols[0], changed_cols[-1] + 1)
+                self.buffer[rows, cols] = frame[rows, cols]
+                # repaint only the part of the widget showing the changed pixels
+                self.update(self.pixelsRect(rows.start, rows.stop, cols.start, cols.stop))
         self.lastUpdate = timer()  # update the lastUpdate time
-        try:
-            self.V_margin = (self.size().width() - self.pixmap().size().width()) / 2
-            self.H_margin = (self.size().height() - self.pixmap().size().height()) / 2
-        except AttributeError:
-            self.V_margin = 0
-            self.H_margin = 0
 
+    def set_board_size(self, shape):
+        """Sets the board shape, a new board is shown whole"""
+        self.h, self.w = shape
+        self.zoom = 1.0
+        self.center = None
+        self.updateTargetRect()
+
+    def set_image_size(self, shape):
+        """Creates the image (and the buffer sharing its memory) of the shape"""
+        rows, cols = shape
+        self.image = QImage(cols, rows, QImage.Format_Indexed8)
+        self.image.setColorTable(COLOR_TABLE)
+        bits = self.image.bits()
+        bits.setsize(self.image.byteCount())
+        # lines of QImage are 32-bit aligned
+        lines = np.frombuffer(bits, dtype=np.uint8).reshape(rows, self.image.bytesPerLine())
+        self.buffer = lines[:, :cols]
+
+    def updateTargetRect(self):
+        """Calculates the shown part of the board for the zoom and center, the widget rectangle keeping its aspect
+        ratio and the margins around it"""
+        if not self.h or not self.w:
+            return
+        visible_rows, visible_cols = self.h / self.zoom, self.w / self.zoom
+        center_row, center_col = self.center or (self.h / 2, self.w / 2)
+        # the shown part stays inside the board
+        center_row = min(max(center_row, visible_rows / 2), self.h - visible_rows / 2)
+        center_col = min(max(center_col, visible_cols / 2), self.w - visible_cols / 2)
+        self.center = (center_row, center_col)
+        row_start = max(int(center_row - visible_rows / 2), 0)
+        col_start = max(int(center_col - visible_cols / 2), 0)
+        row_stop = min(int(np.ceil(center_row + visible_rows / 2)), self.h)
+        col_stop = min(int(np.ceil(center_col + visible_cols / 2)), self.w)
+        rows, cols = row_stop - row_start, col_stop - col_start
+        scale = min(self.width() / cols, self.height() / rows)  # pixels per cell
+        # when cells are smaller than pixels, factor x factor cells are reduced to one pixel of the image
+        factor = max(int(1 / scale), 1) if scale > 0 else 1
+        width = int(-(-cols // factor) * factor * scale)
+        height = int(-(-rows // factor) * factor * scale)
+        self.V_margin = (self.width() - width) / 2
+        self.H_margin = (self.height() - height) / 2
+        self.target_rect = QRect(int(self.V_margin), int(self.H_margin), width, height)
+        self.view = ((row_start, row_stop, col_start, col_stop), factor)
+        if self.worker is not None:
+            self.worker.view = self.view
+
+    def cellScale(self):
+        """Widget pixels per cell in the horizontal and vertical direction"""
+        (row_start, row_stop, col_start, col_stop), factor = self.view
+        return (self.target_rect.width() / (-(-(col_stop - col_start) // factor) * factor),
+                self.target_rect.height() / (-(-(row_stop - row_start) // factor) * factor))
+
+    def pixelsRect(self, row_start, row_stop, col_start, col_stop):
+        """Widget rectangle covering the pixels of the image (stop values are exclusive)"""
+        x_scale = self.target_rect.width() / self.buffer.shape[1]
+        y_scale = self.target_rect.height() / self.buffer.shape[0]
+        left = self.target_rect.x() + int(col_start * x_scale)
+        top = self.target_rect.y() + int(row_start * y_scale)
+        right = self.target_rect.x() + int(col_stop * x_scale) + 1
+        bottom = self.target_rect.y() + int(row_stop * y_scale) + 1
+        return QRect(left, top, right - left + 1, bottom - top + 1)
+
+    def zoomAt(self, zoom, x, y):
+        """Sets the zoom keeping the cell under the widget position (x, y with margin correction) in place"""
+        max_zoom = max(min(self.h, self.w) / MIN_VISIBLE_CELLS, 1)
+        zoom = min(max(zoom, 1.0), max_zoom)
+        x_scale, y_scale = self.cellScale()
+        (row_start, _, col_start, _), _ = self.view
+        anchor_row, anchor_col = row_start + y / y_scale, col_start + x / x_scale
+        center_row, center_col = self.center
+        ratio = self.zoom / zoom
+        self.center = (anchor_row + (center_row - anchor_row) * ratio, anchor_col + (center_col - anchor_col) * ratio)
+        self.zoom = zoom
+        self.updateTargetRect()
+        self.updateView()
+
+    def panBy(self, dx, dy):
+        """Moves the shown part of the board by the widget distance (dx, dy)"""
+        x_scale, y_scale = self.cellScale()
+        center_row, center_col = self.center
+        self.center = (center_row - dy / y_scale, center_col - dx / x_scale)
+        self.updateTargetRect()
+        self.updateView()
+
+    def resizeEvent(self, event):
+        """Slot for resize event (Override)"""
+        super().resizeEvent(event)
+        self.updateTargetRect()
+        if self.view is not None and self.buffer is not None:
+            self.updateView()
+
+    def wheelEvent(self, event):
+        """Slot for mouse wheel event (Override): zooms in or out around the cursor"""
+        steps = event.angleDelta().y() / 120
+        if not steps or self.view is None:
+            return
+        x, y = self.getXYPosition(event, marginCorrection=True)
+        x = min(max(x, 0), self.target_rect.width())
+        y = min(max(y, 0), self.target_rect.height())
+        self.zoomAt(self.zoom * ZOOM_STEP ** steps, x, y)
+
+    @timed('paint')
+    def paintEvent(self, event):
+        """Slot for paint event (Override): paints the image scaled to target_rect"""
+        super().paintEvent(event)
+        if self.image is None or self.target_rect.isEmpty():
+            return
+        painter = QPainter(self)
+        painter.drawImage(self.target_rect, self.image)
+        painter.end()
+
+    @timed('to_qimage')
     def toQImage(self, im):
         """
         Utility method to convert a numpy array to a QImage object.
@@ -90,18 +266,20 @@ class MapViewer(QLabel):
         Returns:
             QImage      The image created converting the numpy array
         """
-        gray_color_table = [qRgb(i, i, i) for i in range(256)]
         if im is None:
             return QImage()
         if len(im.shape) == 2:  # 1 channel image
             qim = QImage(im.data, im.shape[1], im.shape[0], im.strides[0], QImage.Format_Indexed8)
-            qim.setColorTable(gray_color_table)
+            qim.setColorTable(COLOR_TABLE)
             return qim
 
     def mousePressEvent(self, event):
         """Slot for mouse press event (Override)"""
-        self.handleMouseClickEvent(event, mouseButton=Qt.RightButton, color=0)
-        self.handleMouseClickEvent(event, mouseButton=Qt.LeftButton, color=255)
+        if event.button() == Qt.MiddleButton:
+            self.panning = event.pos()  # the middle button drags the view
+            return
+        self.handleMouseClickEvent(event, mouseButton=Qt.RightButton, color=WALL)
+        self.handleMouseClickEvent(event, mouseButton=Qt.LeftButton, color=self.paint_value)
 
     def getXYPosition(self, event, marginCorrection=True):
         """Utility method to get x, y position from event..
@@ -121,16 +299,23 @@ class MapViewer(QLabel):
 
     def mouseMoveEvent(self, event):
         """Slot for mouse move event (Override)"""
-        self.handleMouseMoveEvent(event, mouseButton=Qt.LeftButton, color=255)
-        self.handleMouseMoveEvent(event, mouseButton=Qt.RightButton, color=0)
+        if self.panning is not None:
+            delta = event.pos() - self.panning
+            self.panning = event.pos()
+            self.panBy(delta.x(), delta.y())
+            return
+        self.handleMouseMoveEvent(event, mouseButton=Qt.LeftButton, color=self.paint_value)
+        self.handleMouseMoveEvent(event, mouseButton=Qt.RightButton, color=WALL)
 
     def mouseReleaseEvent(self, event):
         """Slot for mouse release event (Override)"""
+        if event.button() == Qt.MiddleButton:
+            self.panning = None
         # release the self.drawing mode
-        if event.button() == Qt.LeftButton and self.drawing:
-            self.drawing = False
-        if event.button() == Qt.RightButton and self.drawing:
+        if event.button() in (Qt.LeftButton, Qt.RightButton) and self.drawing:
             self.drawing = False
+            self.model.end_stroke()  # the whole stroke is one state in the history
+            self.updateView()
 
     def handleMouseClickEvent(self, event, mouseButton, color):
         """Utility method to handle mouse click event on mapViewer object..
@@ -142,12 +327,13 @@ class MapViewer(QLabel):
         """
         if event.button() == mouseButton:
             self.drawing = True
+            self.model.begin_stroke(color, self.brush_radius)
             x, y = self.getXYPosition(event, marginCorrection=True)
             # check if mouse is inside the bounds of the board
             if self.isInBoardBounds(x, y):
                 # convert widget coordinate to state indexes
                 row, col = self.getRowCol(x, y)
-                self.model.set_cell(row, col, color)
+                self.model.stroke_to(row, col)
                 self.updateView()
 
     def handleMouseMoveEvent(self, event, mouseButton, color):
@@ -163,7 +349,7 @@ class MapViewer(QLabel):
             if self.isInBoardBounds(x, y):
                 # convert widget coordinate to state indexes
                 row, col = self.getRowCol(x, y)
-                self.model.set_cell(row, col, color)
+                self.model.stroke_to(row, col)
                 if (timer() - self.lastUpdate) > 0.04:
                     self.updateView()
 
@@ -174,15 +360,20 @@ class MapViewer(QLabel):
         :param y:
         :return:
         """
-        row = int(y * self.h / self.pixmap().height())
-        col = int(x * self.w / self.pixmap().width())
-        return row, col
+        x_scale, y_scale = self.cellScale()
+        (row_start, _, col_start, _), _ = self.view
+        return row_start + int(y / y_scale), col_start + int(x / x_scale)
 
     def isInBoardBounds(self, x, y):
-        """Utility to indicate if click was inside of pixmap.
+        """Utility to indicate if click was inside of the board image.
 
         :param x: x position with margin correction
         :param y: y position with margin correction
-        :return: bool indicating is this click inside of pixmap.
+        :return: bool indicating is this click inside of the board image.
         """
-        return 0 < y < self.pixmap().height() and 0 < x < self.pixmap().width()
+        if not (0 < y < self.target_rect.height() and 0 < x < self.target_rect.width()):
+            return False
+        # the last pixels of the image may show fewer cells than the others
+        (_, row_stop, _, col_stop), _ = self.view
+        row, col = self.getRowCol(x, y)
+        return row < row_stop and col < col_stop
@@ -0,0 +1,224 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+
+"""
+Registry of the materials of the map and the vectorized step kernel driven by it.
+
+A material is a cell value with its movement rules: falling into the empty cell below, sliding down diagonally
+from a pile, flowing sideways (liquids) and sinking through lighter movable materials (swapping with them).
+The registry is compiled into a table indexed by the cell value with the rule flags and the density rank of
+every material, so a step looks up the rules of all the cells with one array lookup and applies them to the
+whole board at once. Values which are not registered behave like walls.
+
+Like in SandEngine.find_moves all the moves are found on the old map: falls and slides into the same cell
+merge (the later rule wins), flows go only into cells nobody else moves into and a cell swaps only with a cell
+which does not move otherwise. On maps of sand, empty cells and walls the result is the same as the one of
+SandEngine.step_vectorized.
+"""
+
+import numpy as np
+
+from SandEngine import SAND, EMPTY, WALL
+
+# rule flags of the compiled table, the density rank is stored in the bits above them
+FALLS = 1
+SLIDES = 2
+FLOWS = 4
+MOVABLE = FALLS | SLIDES | FLOWS
+DENSITY_SHIFT = 3
+
+
+class Material:
+    """
+    Description of a material.
+
+    Attributes:
+        name        name shown to the user
+        value       cell value of the material in the map (uint8)
+        char        character of the material in the text patterns
+        colour      (red, green, blue) of the material in the view
+        density     materials which fall sink through lighter movable ones
+        falls       moves into the empty cell below
+        slides      moves down diagonally when it lies on a movable material it cannot sink into
+        flows       moves sideways into an empty cell when it cannot fall or slide (liquids)
+    """
+
+    def __init__(self, name, value, char, colour, density=0.0, falls=False, slides=False, flows=False):
+        self.name = name
+        self.value = value
+        self.char = char
+        self.colour = tuple(colour)
+        self.density = density
+        self.falls = falls
+        self.slides = slides
+        self.flows = flows
+
+    @property
+    def flags(self):
+        return (FALLS if self.falls else 0) | (SLIDES if self.slides else 0) | (FLOWS if self.flows else 0)
+
+
+# registered materials by cell value, the values are also the drawing priority of the zoomed out view
+# (SandEngine.downsample keeps the smallest value of a block)
+MATERIALS = {}
+
+
+def register(material):
+    """Adds the material to the registry (replacing the one with the same value), returns it."""
+    if not 0 <= material.value <= 255:
+        raise ValueError(f'cell value {material.value} of {material.name} is not a uint8 value')
+    if material.value in (EMPTY, WALL) and material.flags:
+        raise ValueError('empty cells and walls cannot move')
+    clash = next((other for other in MATERIALS.values()
+                  if other.char == material.char and other.value != material.value), None)
+    if clash is not None:
+        raise ValueError(f"character '{material.char}' is already used by {clash.name}")
+    MATERIALS[material.value] = material
+    return material
+
+
+WALL_MATERIAL = register(Material('wall', WALL, 'x', (0, 0, 0)))
+GRAVEL = register(Material('gravel', 60, 'g', (96, 72, 48), density=3.0, falls=True, slides=True))
+SAND_MATERIAL = register(Material('sand', SAND, 'o', (100, 100, 100), density=2.0, falls=True, slides=True))
+WATER = register(Material('water', 160, 'w', (64, 128, 224), density=1.0, falls=True, slides=True, flows=True))
+EMPTY_MATERIAL = register(Material('empty', EMPTY, '.', (255, 255, 255)))
+
+
+def compile_rules(materials=None):
+    """Returns the table of the rules of 256 cell values: flags | density rank << DENSITY_SHIFT.
+
+    Unregistered values have no flags (walls).
+    """
+    materials = list((materials or MATERIALS).values())
+    rules = np.zeros(256, dtype=np.uint8)
+    ranks = {value: rank for rank, value in enumerate(sorted({material.density for material in materials}))}
+    if len(ranks) > 256 >> DENSITY_SHIFT:
+        raise ValueError(f'at most {256 >> DENSITY_SHIFT} different densities are supported')
+    for material in materials:
+        rules[material.value] = material.flags | ranks[material.density] << DENSITY_SHIFT
+    return rules
+
+
+def colour_table(materials=None):
+    """(red, green, blue) of every cell value, unregistered values are gray levels."""
+    colours = [(value, value, value) for value in range(256)]
+    for material in (materials or MATERIALS).values():
+        colours[material.value] = material.colour
+    return colours
+
+
+class MaterialKernel:
+    """
+    Step of maps of any registered materials with whole-array operations.
+
+    Attributes:
+        rules       rule flags and density rank by cell value, see compile_rules
+        others      True for the values of movable materials other than sand, see needed
+        changed     flat indexes of the cells changed by the last step
+        before      values of these cells before the step
+        moved       number of cells which moved in the last step
+    """
+
+    def __init__(self, materials=None):
+        self.rules = compile_rules(materials)
+        self.others = (self.rules & MOVABLE) != 0
+        self.others[SAND] = False
+        self.changed = np.empty(0, dtype=np.intp)
+        self.before = np.empty(0, dtype=np.uint8)
+        self.moved = 0
+
+    def needed(self, grid):
+        """True when the map has movable materials other than sand, which the sand engines treat as walls."""
+        return bool(np.take(self.others, grid).any())
+
+    def step(self, grid, in_place=False):
+        """Calculates the next state of the map.
+
+        :param grid: 2D uint8 array with the current state of the map.
+        :param in_place: when True the grid is updated in place, otherwise it is not modified.
+        :return: tuple (new_grid, was_change), the same as SandEngine.step_vectorized.
+        """
+        new_grid = grid if in_place else np.copy(grid)
+        if grid.shape[0] < 2:
+            self.changed, self.before, self.moved = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.uint8), 0
+            return new_grid, False
+        flags = np.take(self.rules, grid)
+        density = flags >> DENSITY_SHIFT
+        empty = grid == EMPTY
+        movable = (flags & MOVABLE) != 0
+        falling = (flags[:-1] & FALLS) != 0
+        # a falling cell sinks through a lighter movable one, it rests on a movable one it cannot sink into
+        lighter = movable[1:] & (density[1:] < density[:-1])
+        fall = falling & empty[1:]
+        resting = ((flags[:-1] & SLIDES) != 0) & movable[1:] & ~lighter
+        left = np.zeros_like(fall)
+        right = np.zeros_like(fall)
+        # the same conditions as in SandEngine.find_moves
+        left[:, 1:] = resting[:, 1:] & empty[:-1, :-1] & empty[1:, :-1]
+        right[:, :-1] = resting[:, :-1] & ~left[:, :-1] & empty[:-1, 1:] & empty[1:, 1:]
+        source = np.zeros_like(empty)
+        source[:-1] = fall | left | right
+        target = np.zeros_like(empty)
+        target[1:] = fall
+        target[1:, :-1] |= left[:, 1:]
+        target[1:, 1:] |= right[:, :-1]
+        # liquids flow sideways into the empty cells which nothing falls or slides into
+        still = ((flags & FLOWS) != 0) & ~source
+        free = empty & ~target
+        flow_left = np.zeros_like(empty)
+        flow_right = np.zeros_like(empty)
+        flow_left[:, 1:] = still[:, 1:] & free[:, :-1]
+        flow_right[:, :-1] = still[:, :-1] & ~flow_left[:, :-1] & free[:, 1:]
+        # two liquids do not flow into the same cell, the one from the right goes first
+        flow_right[:, :-2] &= ~flow_left[:, 2:]
+        source |= flow_left | flow_right
+        target[:, :-1] |= flow_left[:, 1:]
+        target[:, 1:] |= flow_right[:, :-1]
+        # swaps of cells which do not move otherwise, a cell swapped with the one above does not swap below
+        swap = falling & lighter & ~source[:-1] & ~source[1:]
+        swap[1:] &= ~swap[:-1]
+        changed = source | target
+        changed[:-1] |= swap
+        changed[1:] |= swap
+        self.changed = np.flatnonzero(changed)
+        self.before = grid.ravel()[self.changed]
+        self.moved = int(np.count_nonzero(source)) + int(np.count_nonzero(swap))
+        if not self.changed.size:
+            return new_grid, False
+        # the moved values are taken before the grid is written, it may be the same array
+        upper = grid[:-1]
+        fall_values, left_values, right_values = upper[fall], upper[left], upper[right]
+        flow_left_values, flow_right_values = grid[flow_left], grid[flow_right]
+        top_values, bottom_values = upper[swap], grid[1:][swap]
+        new_grid[source] = EMPTY
+        below = new_grid[1:]
+        below[fall] = fall_values
+        below[:, :-1][left[:, 1:]] = left_values
+        below[:, 1:][right[:, :-1]] = right_values
+        new_grid[:, :-1][flow_left[:, 1:]] = flow_left_values
+        new_grid[:, 1:][flow_right[:, :-1]] = flow_right_values
+        new_grid[:-1][swap] = bottom_values
+        below[swap] = top_values
+        return new_grid, True
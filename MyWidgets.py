@@ -26,6 +26,10 @@ import sys
 
 from PyQt5.QtWidgets import QComboBox, QPushButton
 
+import PatternIO
+from Materials import MATERIALS
+from SandEngine import EMPTY, WALL
+
 
 class PatternMenu(QComboBox):
     """
@@ -33,15 +37,15 @@ class PatternMenu(QComboBox):
 
     Attributes:
         path_to_patterns    default directory for patterns
-        files               string list of the file names of the files in path_to_patterns
+        files               string list of the names of the patterns in path_to_patterns (see PatternIO.pattern_names)
     """
 
     def __init__(self):
         super().__init__()
         self.path_to_patterns = os.path.join(os.path.abspath(os.path.dirname(sys.argv[0])), 'patterns')
-        self.files = set([f for f in os.listdir(self.path_to_patterns) if not f.startswith('.')])
+        self.files = PatternIO.pattern_names(self.path_to_patterns)
         self.addItems(self.files)
-        self.setCurrentText('middleBow' if 'middleBow' in self.files else self.files.pop())
+        self.setCurrentText('middleBow' if 'middleBow' in self.files else self.files[-1])
 
 
 class SandGenerateMethodMenu(QComboBox):
@@ -51,6 +55,17 @@ class SandGenerateMethodMenu(QComboBox):
         self.addItem("Central top two cells")
 
 
+class MaterialMenu(QComboBox):
+    """Combo box of the registered materials painted with the left mouse button, the item data is the cell value"""
+
+    def __init__(self):
+        super().__init__()
+        for value, material in sorted(MATERIALS.items()):
+            if value != WALL:
+                self.addItem(material.name, value)
+        self.setCurrentIndex(self.findData(EMPTY))
+
+
 class PlayPauseButton(QPushButton):
     """
         Custom push button that toggles automatically Play and Pause texts
@@ -0,0 +1,119 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Parallel stepping of the map split into horizontal bands.
+
+The current and the next state live in shared memory (multiprocessing.shared_memory). Every band is stepped by
+a process of a pool: it reads its rows together with one halo row above and below from the current state and
+writes only its own rows of the next state. Grains in the row above the band may move into the band and grains
+in the last row of the band look at the row below it, both are visible thanks to the halo rows. Every cell of
+the next state is written by exactly one band, so the result is the same as the one of step_vectorized.
+"""
+
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from SandEngine import find_moves, apply_moves
+
+# shared buffers attached in a worker process by attach_buffers
+worker_buffers = {}
+
+
+def attach_buffers(current_name, next_name, shape):
+    """Initializer of the pool processes: attaches the shared buffers."""
+    for key, name in (('current', current_name), ('next', next_name)):
+        memory = SharedMemory(name=name)
+        worker_buffers[key] = (memory, np.ndarray(shape, dtype=np.uint8, buffer=memory.buf))
+
+
+def step_band(band):
+    """Writes rows [start, stop) of the next state, returns bool indicating if any of these rows changed."""
+    start, stop = band
+    current = worker_buffers['current'][1]
+    next_state = worker_buffers['next'][1]
+    window_start = max(start - 1, 0)
+    window_stop = min(stop + 1, current.shape[0])
+    window = current[window_start:window_stop]
+    new_window = np.copy(window)
+    if window.shape[0] >= 2:
+        apply_moves(new_window, *find_moves(window))
+    own = slice(start - window_start, stop - window_start)
+    np.copyto(next_state[start:stop], new_window[own])
+    return not np.array_equal(window[own], new_window[own])
+
+
+def release(pool, memories):
+    pool.shutdown(wait=True, cancel_futures=True)
+    for memory in memories:
+        memory.close()
+        memory.unlink()
+
+
+class ParallelEngine:
+    """
+    Steps a map of the given shape in a pool of processes.
+
+    Attributes:
+        shape       shape of the stepped maps
+        workers     number of processes
+        bands       list of (start, stop) rows of the bands, one per process
+    """
+
+    def __init__(self, shape, workers=None):
+        self.shape = tuple(shape)
+        self.workers = workers or os.cpu_count() or 1
+        edges = np.linspace(0, self.shape[0], min(self.workers, self.shape[0]) + 1).astype(int)
+        self.bands = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+        size = max(self.shape[0] * self.shape[1], 1)
+        self.memories = [SharedMemory(create=True, size=size) for _ in range(2)]
+        self.current = np.ndarray(self.shape, dtype=np.uint8, buffer=self.memories[0].buf)
+        self.next_state = np.ndarray(self.shape, dtype=np.uint8, buffer=self.memories[1].buf)
+        self.pool = ProcessPoolExecutor(self.workers, initializer=attach_buffers,
+                                        initargs=(self.memories[0].name, self.memories[1].name, self.shape))
+        # the pool and the shared memory are released with close() or when the engine is garbage collected
+        self.finalizer = weakref.finalize(self, release, self.pool, self.memories)
+
+    def step(self, grid, out=None):
+        """Calculates the next state of the map.
+
+        :param grid: 2D uint8 array of the engine shape. It is not modified.
+        :param out: array of the engine shape for the next state, a new one is allocated when None.
+        :return: tuple (new_grid, was_change), the same as step_vectorized.
+        """
+        np.copyto(self.current, grid)
+        changes = list(self.pool.map(step_band, self.bands))
+        if out is None:
+            return np.copy(self.next_state), any(changes)
+        np.copyto(out, self.next_state)
+        return out, any(changes)
+
+    def close(self):
+        # views of the shared memory have to be dropped before it is closed
+        self.current = self.next_state = None
+        self.finalizer()
@@ -0,0 +1,151 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Reading and writing of the patterns.
+
+Two formats are supported:
+    text    lines of 'x' (wall), '.' (empty), 'o' (sand) and the characters of the other materials (see
+            Materials.py, e.g. 'w' water and 'g' gravel), spaces are ignored
+    binary  .npy file with the uint8 map, loaded with memory mapping and copied in one operation
+
+A text pattern can be converted to the binary format next to it (patterns/bowl -> patterns/bowl.npy):
+    python PatternIO.py patterns/bowl patterns/small_bowl
+When both versions exist the binary one is used, unless the text file was modified after the conversion.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from Materials import MATERIALS
+from SandEngine import WALL
+
+BINARY_EXTENSION = '.npy'
+
+# map of the text characters to cells, unknown characters are walls
+CELLS_BY_CHAR = np.full(256, WALL, dtype=np.uint8)
+# map of the cells to the text characters, unknown cells are written as empty
+CHARS_BY_CELL = np.full(256, ord('.'), dtype=np.uint8)
+for material in MATERIALS.values():
+    CELLS_BY_CHAR[ord(material.char)] = material.value
+    CHARS_BY_CELL[material.value] = ord(material.char)
+
+
+def parse_text(data):
+    """Converts the content (bytes) of a text pattern to a map.
+
+    The width of the map is the length of the first line. Shorter lines are completed with walls.
+
+    :return: 2D uint8 array or None when there are no lines.
+    """
+    lines = data.replace(b' ', b'').replace(b'\r', b'').split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()  # the file ends with a new line
+    if not lines:
+        return None
+    cols = len(lines[0])
+    if all(len(line) == cols for line in lines):
+        chars = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(len(lines), cols)
+        return CELLS_BY_CHAR[chars]
+    grid = np.full((len(lines), cols), WALL, dtype=np.uint8)
+    for row, line in enumerate(lines):
+        if len(line) > cols:
+            raise ValueError(f'line {row + 1} is longer than the first line')
+        grid[row, :len(line)] = CELLS_BY_CHAR[np.frombuffer(line, dtype=np.uint8)]
+    return grid
+
+
+def format_text(grid):
+    """Converts the map to the content (str) of a text pattern."""
+    return '\n'.join(line.tobytes().decode('ascii') for line in CHARS_BY_CELL[grid])
+
+
+def resolve(filepath):
+    """Returns the path of the file to load for the pattern path, preferring an up to date binary version."""
+    if filepath.endswith(BINARY_EXTENSION):
+        return filepath
+    binary = filepath + BINARY_EXTENSION
+    if os.path.exists(binary) and (not os.path.exists(filepath) or
+                                   os.path.getmtime(binary) >= os.path.getmtime(filepath)):
+        return binary
+    return filepath
+
+
+def load(filepath):
+    """Loads the pattern (text or binary) from the path.
+
+    :return: 2D uint8 array or None when the pattern is empty. Binary patterns are returned as read-only memory
+        maps, the caller makes the copy it needs (see SandModel.load_map).
+    """
+    filepath = resolve(filepath)
+    if filepath.endswith(BINARY_EXTENSION):
+        mapped = np.load(filepath, mmap_mode='r')
+        if mapped.ndim != 2 or mapped.dtype != np.uint8:
+            raise ValueError(f'{filepath} is not a 2D uint8 map')
+        return mapped
+    with open(filepath, 'rb') as file:
+        return parse_text(file.read())
+
+
+def save_text(grid, filepath):
+    with open(filepath, 'w') as file:
+        file.write(format_text(grid))
+
+
+def save_binary(grid, filepath):
+    np.save(filepath, np.ascontiguousarray(grid, dtype=np.uint8))
+
+
+def pattern_names(directory):
+    """Returns the sorted names of the patterns in the directory, binary versions are listed by the text name."""
+    names = set()
+    for filename in os.listdir(directory):
+        if filename.startswith('.'):
+            continue
+        if filename.endswith(BINARY_EXTENSION):
+            filename = filename[:-len(BINARY_EXTENSION)]
+        names.add(filename)
+    return sorted(names)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert text patterns to the binary format.')
+    parser.add_argument('patterns', nargs='+', help='paths of the text patterns')
+    args = parser.parse_args(argv)
+    for filepath in args.patterns:
+        with open(filepath, 'rb') as file:
+            grid = parse_text(file.read())
+        if grid is None:
+            print(f'{filepath} is empty, skipped', file=sys.stderr)
+            continue
+        save_binary(grid, filepath + BINARY_EXTENSION)
+        print(f'{filepath} -> {filepath + BINARY_EXTENSION} {grid.shape[0]}x{grid.shape[1]}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
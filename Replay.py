@@ -0,0 +1,122 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Deterministic replay of a simulation from its InputLog.
+
+The Replayer loads the initial map of the log into its own model and calculates the steps, applying every
+edit at the step it was recorded at. Every keyframe_interval steps a checkpoint of the model is cached, so
+seeking to a step recalculates only the steps after the nearest cached checkpoint before it.
+
+    replayer = Replayer(InputLog.load('bug.replay.npz'))
+    state = replayer.seek(1500)
+"""
+
+import copy
+
+import numpy as np
+
+from SandModel import SandModel
+from settings import DEFAULT_ENGINE, REPLAY_KEYFRAME_INTERVAL
+
+
+class ReplayError(Exception):
+    """The log does not match the replayed simulation."""
+
+
+class Replayer:
+    """
+    Calculates the states of a simulation recorded in an InputLog.
+
+    Attributes:
+        log                 the replayed InputLog
+        model               SandModel the simulation is replayed in
+        keyframe_interval   number of steps between two cached checkpoints
+        keyframes           dictionary step -> (index of the next event, checkpoint, brush stroke in progress)
+        position            index of the next event to apply
+    """
+
+    def __init__(self, log, keyframe_interval=REPLAY_KEYFRAME_INTERVAL, model=None, engine=DEFAULT_ENGINE):
+        self.log = log
+        self.model = model if model is not None else SandModel(engine=engine, pattern=None)
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.keyframes = {}
+        self.restart()
+
+    def restart(self):
+        """Loads the initial map of the log."""
+        self.model.load_map(self.log.initial, self.log.name, self.log.first_step)
+        self.position = 0
+
+    def restore(self, step):
+        """Continues from the cached checkpoint of the step."""
+        self.position, checkpoint, stroke = self.keyframes[step]
+        self.model.set_checkpoint(checkpoint)
+        self.model.stroke = copy.deepcopy(stroke)
+
+    def apply(self, event):
+        """Repeats the recorded edit on the model."""
+        getattr(self.model, event['action'])(**event['args'])
+
+    def seek(self, step):
+        """Replays the simulation to the step, including the edits made at it.
+
+        :return: the map of the model at the step (the replay continues from it on the next seek).
+        """
+        model = self.model
+        if model.steps > step:
+            self.restart()
+        cached = [cached for cached in self.keyframes if model.steps < cached <= step]
+        if cached:
+            self.restore(max(cached))
+        events = self.log.events
+        while True:
+            while self.position < len(events) and events[self.position]['step'] <= model.steps:
+                self.apply(events[self.position])
+                self.position += 1
+            if model.steps >= step:
+                return model.map
+            if model.steps % self.keyframe_interval == 0 and model.steps not in self.keyframes:
+                self.keyframes[model.steps] = (self.position, model.get_checkpoint(), copy.deepcopy(model.stroke))
+            model.calculate_next_state()
+            if model.finished and model.was_change and self.position == len(events):
+                return model.map  # the grains move in a cycle after the last edit
+            if model.finished and not model.was_change:
+                if self.position < len(events):
+                    raise ReplayError(f'the simulation settled at step {model.steps}, '
+                                      f'but the next edit was made at step {events[self.position]["step"]}')
+                return model.map  # nothing changes after the last edit any more
+
+    def advance(self, steps):
+        """Replays at most steps more steps towards the end of run, returns True when the end was reached."""
+        end = self.log.end_step if self.log.end_step is not None else np.iinfo(np.int64).max
+        self.seek(min(end, self.model.steps + steps))
+        return self.model.steps >= end or self.model.finished
+
+    def run(self):
+        """Replays the log to the step it was saved at, returns the final map.
+
+        Logs without the end step are replayed until no grain moves after the last edit.
+        """
+        return self.seek(self.log.end_step if self.log.end_step is not None else np.iinfo(np.int64).max)
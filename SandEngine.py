@@ -0,0 +1,360 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+"""
+Whole-array implementation of the falling sand rules.
+
+Every decision of the scalar engine (FallingSand.handleSandMoveFor) is taken on the previous
+state of the map, and every write is either "source cell becomes EMPTY" or "target cell becomes SAND".
+A source is always a SAND cell and a target is always an EMPTY cell of the previous state, so the writes
+never overlap and the order in which grains are visited does not change the result. Two grains sliding
+into the same cell both leave their source, exactly like in the scalar engine.
+"""
+
+import numpy as np
+
+SAND = 100
+EMPTY = 255
+WALL = 0
+
+SCALAR_ENGINE = 'scalar'
+VECTORIZED_ENGINE = 'vectorized'
+PARALLEL_ENGINE = 'parallel'  # see ParallelEngine
+SPARSE_ENGINE = 'sparse'  # see SparseGrains
+MATERIALS_ENGINE = 'materials'  # see Materials.MaterialKernel
+AUTO_ENGINE = 'auto'  # 'vectorized' or 'sparse' chosen by the density of the grains, 'materials' for other materials
+ENGINES = (AUTO_ENGINE, VECTORIZED_ENGINE, SPARSE_ENGINE, SCALAR_ENGINE, PARALLEL_ENGINE, MATERIALS_ENGINE)
+
+
+def find_moves(grid):
+    """Calculates which grains move in the next step.
+
+    :param grid: 2D uint8 array with the current state of the map, or a stack of maps (boards, rows, cols).
+    :return: tuple of boolean masks (fall, left, right) of shape (rows - 1, cols) (stacked like grid). True at
+        [row, col] means the grain at grid[row, col] moves down, down-left or down-right respectively.
+    """
+    sand = grid == SAND
+    empty = grid == EMPTY
+    grains = sand[..., :-1, :]
+    fall = grains & empty[..., 1:, :]
+    resting = grains & sand[..., 1:, :]
+    left = np.zeros_like(fall)
+    right = np.zeros_like(fall)
+    # the left cell and the left below cell have to be empty
+    left[..., 1:] = resting[..., 1:] & empty[..., :-1, :-1] & empty[..., 1:, :-1]
+    # right slide is checked only when left one is not possible
+    right[..., :-1] = resting[..., :-1] & ~left[..., :-1] & empty[..., :-1, 1:] & empty[..., 1:, 1:]
+    return fall, left, right
+
+
+def apply_moves(grid, fall, left, right, moving=None):
+    """Applies moves calculated by find_moves to grid (in place).
+
+    :param moving: fall | left | right when already calculated by the caller.
+    :return: bool indicating if any grain moved.
+    """
+    if moving is None:
+        moving = fall | left | right
+    if not moving.any():
+        return False
+    grid[..., :-1, :][moving] = EMPTY
+    below = grid[..., 1:, :]
+    below[fall] = SAND
+    below[..., :-1][left[..., 1:]] = SAND
+    below[..., 1:][right[..., :-1]] = SAND
+    return True
+
+
+def merged_targets(grid, right_sources):
+    """Flat indexes of the cells into which two grains slide in the next step, one from each side.
+
+    Only a right slide and a left slide can end in the same cell: the grain two columns to the right of a grain
+    sliding right slides left into the same cell when it rests on sand (the cells between them are empty).
+
+    :param grid: 2D uint8 array with the current state of the map.
+    :param right_sources: flat indexes of the grains sliding down-right.
+    """
+    cols = grid.shape[1]
+    flat = grid.reshape(-1)
+    candidates = right_sources[right_sources % cols < cols - 2]
+    merging = (flat[candidates + 2] == SAND) & (flat[candidates + 2 + cols] == SAND)
+    return candidates[merging] + cols + 1
+
+
+def _chunk_runs(mask):
+    """Yields (start, stop) of the runs of True values in 1D boolean mask."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return zip(edges[::2], edges[1::2])
+
+
+class ActiveChunks:
+    """
+    Tracks which chunks of the map may contain moving grains.
+
+    A grain decides its move looking only at the cells next to it, so a grain which did not move in
+    the last step will not move in the next one unless something changed around it. A chunk is active
+    when it or one of its 8 neighbouring chunks changed since the previous step.
+
+    Attributes:
+        shape       shape of the tracked map
+        chunk_size  length of the chunk side in cells
+        dirty       boolean array with one value per chunk, True when the chunk changed
+        moves       moves found in the last step, see moved_cells
+        merged      flat indexes of the cells into which two grains moved in the last step
+    """
+
+    def __init__(self, shape, chunk_size):
+        if chunk_size < 2:
+            raise ValueError('chunk_size has to be at least 2')
+        self.shape = shape
+        self.chunk_size = chunk_size
+        self.dirty = np.ones((-(-shape[0] // chunk_size), -(-shape[1] // chunk_size)), dtype=bool)
+        self.moves = []
+        self.merged = np.empty(0, dtype=np.intp)
+
+    def wake_all(self):
+        self.dirty[:] = True
+
+    def wake(self, row_start, row_stop, col_start, col_stop):
+        """Marks chunks touching the given rectangle of cells (stop values are exclusive) as changed."""
+        if row_stop <= row_start or col_stop <= col_start:
+            return
+        size = self.chunk_size
+        self.dirty[row_start // size:(row_stop - 1) // size + 1, col_start // size:(col_stop - 1) // size + 1] = True
+
+    def wake_cells(self, rows, cols):
+        """Marks chunks containing the cells given as index arrays as changed."""
+        self.dirty[rows // self.chunk_size, cols // self.chunk_size] = True
+
+    def active(self):
+        """Returns the boolean array of chunks which have to be visited in the next step."""
+        dirty = self.dirty
+        active = dirty.copy()
+        active[1:] |= dirty[:-1]
+        active[:-1] |= dirty[1:]
+        spread = active.copy()
+        active[:, 1:] |= spread[:, :-1]
+        active[:, :-1] |= spread[:, 1:]
+        return active
+
+    def step(self, grid, in_place=False):
+        """Calculates the next state of the map visiting only the active chunks.
+
+        :param grid: 2D uint8 array with the current state of the map.
+        :param in_place: when True the grid is updated in place, otherwise it is not modified.
+        :return: tuple (new_grid, was_change), the same as step_vectorized.
+        """
+        rows, cols = grid.shape
+        size = self.chunk_size
+        active = self.active()
+        self.dirty[:] = False
+        # all the moves are found before any of them is applied, the windows overlap
+        moves = []
+        for chunk_row in np.flatnonzero(active.any(axis=1)):
+            row_start = chunk_row * size
+            # one more row is needed to see the cells below the grains
+            row_stop = min(row_start + size + 1, rows)
+            if row_stop - row_start < 2:
+                continue
+            for chunk_start, chunk_stop in _chunk_runs(active[chunk_row]):
+                # one more column on each side to see the left and right neighbours
+                col_start = max(chunk_start * size - 1, 0)
+                col_stop = min(chunk_stop * size + 1, cols)
+                fall, left, right = find_moves(grid[row_start:row_stop, col_start:col_stop])
+                # grains in the extra columns belong to other chunks and are handled there
+                first, last = chunk_start * size - col_start, chunk_stop * size - col_start
+                for mask in (fall, left, right):
+                    mask[:, :first] = False
+                    mask[:, last:] = False
+                moved_cols = (fall | left | right)[:, first:last].any(axis=0)
+                if not moved_cols.any():
+                    continue
+                # a chunk with a moved grain is dirty, its targets are at most one cell away
+                # so they are covered by the neighbouring chunks made active in the next step
+                self.dirty[chunk_row, chunk_start:chunk_stop] = np.logical_or.reduceat(
+                    moved_cols, np.arange(0, moved_cols.size, size))
+                moves.append((row_start, row_stop, col_start, col_stop, fall, left, right))
+        right_sources = [np.empty(0, dtype=np.intp)]
+        for row_start, row_stop, col_start, col_stop, fall, left, right in moves:
+            right_rows, right_cols = np.nonzero(right)
+            right_sources.append((right_rows + row_start) * cols + right_cols + col_start)
+        # the merges are found on the old map, before the moves are applied to it
+        self.merged = merged_targets(grid, np.concatenate(right_sources))
+        new_grid = grid if in_place else np.copy(grid)
+        for row_start, row_stop, col_start, col_stop, fall, left, right in moves:
+            apply_moves(new_grid[row_start:row_stop, col_start:col_stop], fall, left, right)
+        self.moves = moves
+        return new_grid, bool(moves)
+
+    def moved_cells(self):
+        """Returns flat indexes (sources, targets, merged) of the grains moved in the last step, see moves_hash."""
+        cols = self.shape[1]
+        sources, targets = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.intp)]
+        for row_start, row_stop, col_start, col_stop, fall, left, right in self.moves:
+            for mask, shift in ((fall, 0), (left, -1), (right, 1)):
+                rows, columns = np.nonzero(mask)
+                moved = (rows + row_start) * cols + columns + col_start
+                sources.append(moved)
+                targets.append(moved + cols + shift)
+        return np.concatenate(sources), np.concatenate(targets), self.merged
+
+
+class SparseGrains:
+    """
+    List of the grains of the map for boards with few grains.
+
+    The grains are kept as flat indexes sorted bottom-up and right-to-left, the order in which the scalar engine
+    visits them, and a step looks only at the cells around them, so its cost depends on the number of grains
+    and not on the area of the map. The list has to be rebuilt (see invalidate) after the map was changed
+    in any other way than by step.
+
+    Attributes:
+        grains      1D array of flat indexes of the grains in descending order, None when not known
+        sources     flat indexes of the grains moved in the last step
+        targets     flat indexes of the cells they moved to, may repeat when grains merged
+        merged      flat indexes of the cells into which two grains moved (listed twice in targets)
+    """
+
+    def __init__(self):
+        self.grains = None
+        self.sources = self.targets = self.merged = np.empty(0, dtype=np.intp)
+
+    def invalidate(self):
+        self.grains = None
+
+    def rebuild(self, grid):
+        self.grains = np.flatnonzero(grid.reshape(-1) == SAND)[::-1].copy()
+
+    def update(self, grid, added):
+        """Updates the known list after grains were removed from grid and added at the flat indexes added."""
+        if self.grains is None:
+            return
+        kept = self.grains[grid.reshape(-1)[self.grains] == SAND]
+        self.grains = np.unique(np.concatenate((kept, added)))[::-1]
+
+    def step(self, grid, in_place=False):
+        """Calculates the next state of the map moving only the listed grains.
+
+        :param grid: C-contiguous 2D uint8 array with the current state of the map.
+        :param in_place: when True the grid is updated in place, otherwise it is not modified.
+        :return: tuple (new_grid, was_change), the same as step_vectorized.
+        """
+        if self.grains is None:
+            self.rebuild(grid)
+        rows, cols = grid.shape
+        flat = grid.reshape(-1)
+        grains = self.grains
+        column = grains % cols
+        # grains in the last row cannot move, take with mode='clip' keeps their neighbour indexes inside the map
+        inside = grains < (rows - 1) * cols
+        below = np.where(inside, flat.take(grains + cols, mode='clip'), WALL)
+        fall = below == EMPTY
+        resting = below == SAND
+        left = resting & (column > 0) & (flat.take(grains - 1, mode='clip') == EMPTY) & \
+            (flat.take(grains + cols - 1, mode='clip') == EMPTY)
+        right = resting & ~left & (column < cols - 1) & (flat.take(grains + 1, mode='clip') == EMPTY) & \
+            (flat.take(grains + cols + 1, mode='clip') == EMPTY)
+        moving = fall | left | right
+        self.sources = grains[moving]
+        self.targets = np.concatenate((grains[fall] + cols, grains[left] + cols - 1, grains[right] + cols + 1))
+        self.merged = merged_targets(grid, grains[right])
+        new_grid = grid if in_place else np.copy(grid)
+        if not self.sources.size:
+            return new_grid, False
+        new_flat = new_grid.reshape(-1)
+        new_flat[self.sources] = EMPTY
+        new_flat[self.targets] = SAND
+        # np.unique sorts ascending and leaves one grain in the cells into which grains merged
+        self.grains = np.unique(np.concatenate((grains[~moving], self.targets)))[::-1]
+        return new_grid, True
+
+
+def downsample(grid, factor):
+    """Shrinks the map factor times keeping the smallest value of every factor x factor block.
+
+    Walls (0) win over sand (100) and sand over empty cells (255), so single grains stay visible.
+    Blocks on the bottom and right edges may be smaller.
+    """
+    if factor <= 1:
+        return np.copy(grid)
+    rows, cols = grid.shape
+    # every factor-th row (or column) is combined at once with whole-array minimum, rows first
+    # so that the first pass reads contiguous memory and the second one works on a factor times smaller array
+    short = np.full((-(-rows // factor), cols), EMPTY, dtype=grid.dtype)
+    for offset in range(factor):
+        part = grid[offset::factor]
+        np.minimum(short[:part.shape[0]], part, out=short[:part.shape[0]])
+    small = np.full((short.shape[0], -(-cols // factor)), EMPTY, dtype=grid.dtype)
+    for offset in range(factor):
+        part = short[:, offset::factor]
+        np.minimum(small[:, :part.shape[1]], part, out=small[:, :part.shape[1]])
+    return small
+
+
+def cell_keys(indexes, values):
+    """Pseudo-random 64-bit keys (splitmix64) of cells with the given flat indexes and values."""
+    z = indexes.astype(np.uint64) * np.uint64(256) + values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def board_hash(grid):
+    """Zobrist-like hash of the map: xor of the keys of all cells which are not empty."""
+    flat = grid.reshape(-1)
+    indexes = np.flatnonzero(flat != EMPTY)
+    return int(np.bitwise_xor.reduce(cell_keys(indexes, flat[indexes]))) if indexes.size else 0
+
+
+def moves_hash(sources, targets, merged=None):
+    """Value to xor with board_hash of the map before the moves to get board_hash of the map after them.
+
+    :param merged: cells listed twice in targets (see merged_targets), None when targets do not repeat.
+    """
+    # the two keys of a merged cell cancel out, one more leaves the single grain which stays there
+    cells = np.concatenate((sources, targets) + ((merged,) if merged is not None else ()))
+    if not cells.size:
+        return 0
+    return int(np.bitwise_xor.reduce(cell_keys(cells, np.full(cells.size, SAND, dtype=np.uint8))))
+
+
+def changes_hash(indexes, before, after):
+    """Value to xor with board_hash of the map to get board_hash after the cells with the flat indexes changed
+    from the values before to the values after."""
+    keys = np.concatenate((cell_keys(indexes[before != EMPTY], before[before != EMPTY]),
+                           cell_keys(indexes[after != EMPTY], after[after != EMPTY])))
+    return int(np.bitwise_xor.reduce(keys)) if keys.size else 0
+
+
+def step_vectorized(grid):
+    """Calculates the next state of the map with whole-array operations.
+
+    :param grid: 2D uint8 array with the current state of the map. It is not modified.
+    :return: tuple (new_grid, was_change).
+    """
+    new_grid = np.copy(grid)
+    if grid.shape[0] < 2:
+        return new_grid, False
+    was_change = apply_moves(new_grid, *find_moves(grid))
+    return new_grid, was_change
@@ -0,0 +1,723 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+
+import json
+import os
+import threading
+from functools import wraps
+from settings import DISHES_DIR, DEFAULT_ENGINE, CHUNK_SIZE, HISTORY_KEYFRAME_INTERVAL, HISTORY_MEMORY_BUDGET, \
+    PARALLEL_WORKERS, CYCLE_WINDOW, SPARSE_DENSITY, SPARSE_CHECK_INTERVAL, SETTLE_MIXED_STEPS
+import numpy as np
+from SandEngine import SAND, EMPTY, WALL, SCALAR_ENGINE, VECTORIZED_ENGINE, PARALLEL_ENGINE, SPARSE_ENGINE, AUTO_ENGINE, \
+    MATERIALS_ENGINE, ENGINES, ActiveChunks, SparseGrains, board_hash, moves_hash, changes_hash, downsample
+from StateHistory import StateHistory
+import PatternIO
+from ParallelEngine import ParallelEngine
+from Instrumentation import STATS, timed, profiled
+from InputLog import InputLog
+from Flow import Emitter, Sink, apply_flow, from_dict
+from Materials import MaterialKernel
+
+# events emitted by SandModel, see SandModel.subscribe
+END_OF_SIMULATION = 'end_of_simulation'  # no grain moved in the last step
+STEP = 'step'  # a new state was calculated
+STEP_UNLOCKED = 'step_unlocked'  # the thread stepping the model released the lock, see SimulationWorker
+
+# sand generators by the names used on the command line
+GENERATORS = {'top': 'topEdgeGenerator', 'central': 'centralEdgeGenerator'}
+
+
+def generator_region(name, shape):
+    """Returns (rows, cols) slices of the part of a map of the shape filled by the generator of the name."""
+    rows, cols = shape
+    if name == 'top':
+        # the top tenth of the rows, at least one
+        return slice(0, max(rows // 10, 1)), slice(0, cols)
+    # the middle fifth of the columns of the top tenth
+    return slice(0, rows // 10), slice(cols // 10 * 4, cols // 10 * 6)
+
+
+def random_map(rows, cols, density, seed=None):
+    """Creates a map with a wall at the bottom and sand in the upper half, each cell is sand with the density probability.
+
+    :param density: probability (0 - 1) of a sand grain in a cell of the upper half.
+    :param seed: seed for numpy random generator.
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.full((rows, cols), EMPTY, dtype=np.uint8)
+    upper = grid[:max(rows // 2, 1)]
+    upper[rng.random(upper.shape) < density] = SAND
+    grid[-1] = WALL
+    return grid
+
+
+def synchronized(method):
+    """Decorator running the method with the model lock held (the model is stepped from a worker thread)."""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class SandModel:
+    """
+    Falling sand simulation without any GUI dependency.
+
+    Attributes:
+        map             current state of the simulation (2D uint8 array of SAND, EMPTY and WALL cells)
+        states          history of the states
+        history         False when only the current state is kept (no history and no previous steps)
+        back            second buffer of the map for the engines which do not step in place, swapped with map
+        current_state   index of the state shown to the user
+        was_change      bool indicating if any grain moved in the last step
+        finished        bool indicating if the simulation reached a fixed point or a cycle
+        cycle_period    period in steps of the found cycle (1 for a fixed point), None if not found
+        board_hash      hash of the map (see SandEngine.board_hash) updated from the moved grains, None if unknown
+        recent_hashes   state index by board hash for the last CYCLE_WINDOW states calculated without any edit
+        grains          SparseGrains used by the 'sparse' engine, its list is kept only while the engine is used
+        density_check   number of steps before the 'auto' engine counts the grains again
+        materials       MaterialKernel of the registered materials, used by the 'materials' engine
+        mixed           True when the map has other movable materials than sand, None when not known
+        steps           number of calculated steps in which some grain moved
+        grains_moved    number of grains moved in the last calculated step, None when the engine does not count them
+        input_log       InputLog of the edits since the map was loaded, the simulation can be replayed from it
+        emitters        Flow.Emitter list, sand added after every step
+        sinks           Flow.Sink list, sand removed after every step
+        sandGenerator   the last used sand generator method
+        listeners       callbacks registered with subscribe, by event name
+
+    Emits END_OF_SIMULATION (no arguments) when a step does not move any grain or when a state repeats
+    within CYCLE_WINDOW steps, and STEP (with the model) after every calculated state.
+    """
+    rows: int
+    cols: int
+    map: np.ndarray
+    states: StateHistory
+
+    def __init__(self, mode=None, engine=DEFAULT_ENGINE, pattern='middleBow', history=True):
+        self.lock = threading.RLock()
+        self.history = history
+        self.back = None
+        self.listeners = {}
+        self.parallel_engine = None
+        self.stroke = None
+        self.unrecorded = []
+        self.board_hash = None
+        self.recent_hashes = {}
+        self.finished = False
+        self.cycle_period = None
+        self.density_check = 0
+        self.materials = MaterialKernel()
+        self.mixed = None
+        self.steps = 0
+        self.grains_moved = None
+        self.input_log = None
+        self.emitters = []
+        self.sinks = []
+        self.set_engine(engine)
+        self.sandGenerator = self.topEdgeGenerator
+        self.init_states()
+        self.initial_pattern = pattern
+        if pattern is not None:
+            self.read_from_file(pattern)
+        self.mode = mode
+        self.current_state = 0
+        self.was_change = True
+
+    def subscribe(self, event, callback):
+        """Registers the callback called when the event (END_OF_SIMULATION, STEP or STEP_UNLOCKED) is emitted."""
+        self.listeners.setdefault(event, []).append(callback)
+
+    def unsubscribe(self, event, callback):
+        self.listeners.get(event, []).remove(callback)
+
+    def emit(self, event, *args):
+        for callback in list(self.listeners.get(event, [])):
+            callback(*args)
+
+    def set_engine(self, engine):
+        """Selects the engine used by calculate_next_state, one of ENGINES.
+
+        Only the 'materials' engine (and 'auto', which switches to it) moves other materials than sand, the others
+        treat them as walls.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}")
+        self.engine = engine
+        if engine != PARALLEL_ENGINE:
+            self.close()
+
+    def close(self):
+        """Releases the processes and the shared memory of the parallel engine."""
+        if self.parallel_engine is not None:
+            self.parallel_engine.close()
+            self.parallel_engine = None
+
+    def get_parallel_engine(self):
+        """Returns the parallel engine for the current map shape, creating it when needed."""
+        if self.parallel_engine is None or self.parallel_engine.shape != self.map.shape:
+            self.close()
+            self.parallel_engine = ParallelEngine(self.map.shape, PARALLEL_WORKERS)
+        return self.parallel_engine
+
+    @synchronized
+    def topEdgeGenerator(self, density=1.0, seed=None):
+        seed = self.log_generator('topEdgeGenerator', density, seed)
+        rows, cols = generator_region('top', self.map.shape)
+        sands = self.generate_sand(self.map[rows, cols], density, seed)
+        self.map[rows, cols] = sands
+        self.chunks.wake(rows.start, rows.stop, cols.start, cols.stop)
+        self.edited()
+        self.sandGenerator = self.topEdgeGenerator
+        self.sands = sands
+        self.add_state(self.map)
+
+    @synchronized
+    def centralEdgeGenerator(self, density=1.0, seed=None):
+        seed = self.log_generator('centralEdgeGenerator', density, seed)
+        rows, cols = generator_region('central', self.map.shape)
+        sands = self.generate_sand(self.map[rows, cols], density, seed)
+        self.map[rows, cols] = sands
+        self.chunks.wake(rows.start, rows.stop, cols.start, cols.stop)
+        self.edited()
+        self.sandGenerator = self.centralEdgeGenerator
+        self.sands = sands
+        self.add_state(self.map)
+
+    def log_generator(self, name, density, seed):
+        """Records the generator call, returns the seed (a random one is chosen when needed, to replay the call)."""
+        if density < 1 and seed is None:
+            seed = int(np.random.default_rng().integers(2 ** 63))
+        self.log_event(name, density=float(density), seed=seed)
+        return seed
+
+    def log_event(self, action, **args):
+        if self.input_log is not None:
+            self.input_log.record(self.steps, action, **args)
+
+    @staticmethod
+    def generate_sand(region, density=1.0, seed=None):
+        """Returns the region filled with sand, with density < 1 each cell gets a grain with that probability."""
+        if density >= 1:
+            return np.full(region.shape, SAND)
+        rng = np.random.default_rng(seed)
+        return np.where(rng.random(region.shape) < density, SAND, region)
+
+    def get_generator(self, name):
+        """Returns the sand generator method for the name from GENERATORS."""
+        if name not in GENERATORS:
+            raise ValueError(f"Unknown generator '{name}', expected one of {tuple(GENERATORS)}")
+        return getattr(self, GENERATORS[name])
+
+    def init_states(self):
+        self.states = StateHistory(HISTORY_KEYFRAME_INTERVAL, HISTORY_MEMORY_BUDGET, record=self.history)
+        self.current_state = 0
+        self.unrecorded = []
+
+    @synchronized
+    def reset(self):
+        self.load_map(self.initial_state, self.initial_pattern)
+
+    @synchronized
+    def resetButtonAction(self):
+        self.reset()
+
+    def getCellIfExist(self, row, col):
+        if 0 <= row < self.map.shape[0] and 0 <= col < self.map.shape[1]:
+            return self.map[row, col]
+        return None
+
+    def get_left_right_cells(self, row, col):
+        return self.getCellIfExist(row, col - 1), self.getCellIfExist(row, col + 1)
+
+    def get_diagonal_left_right_cells(self, row, col):
+        return self.getCellIfExist(row + 1, col - 1), self.getCellIfExist(row + 1, col + 1)
+
+    def is_cell(self, cell, cellType):
+        if cell is not None and cell == cellType:
+            return True
+        return False
+
+    @synchronized
+    def prev(self):
+        if self.current_state > self.states.first_index:
+            self.current_state -= 1
+
+    @synchronized
+    @timed('next')
+    @profiled
+    def next(self):
+        if self.current_state + 1 >= len(self.states):
+            self.calculate_next_state()
+        else:
+            self.current_state += 1
+
+    def handleSandMoveFor(self, row, col, newMap):
+        """Moves the grain at (row, col) in newMap, returns (bool indicating if the grain moved, newMap)."""
+        moved = False
+        below_cell = self.getCellIfExist(row + 1, col)
+        left_below_cell, right_below_cell = self.get_diagonal_left_right_cells(row, col)
+        left_cell, right_cell = self.get_left_right_cells(row, col)
+        if self.is_cell(below_cell, EMPTY):
+            newMap[row, col] = EMPTY
+            newMap[row + 1, col] = SAND
+            moved = True
+        elif self.is_cell(below_cell, SAND):
+            if self.is_cell(left_cell, EMPTY) and self.is_cell(left_below_cell, EMPTY):
+                newMap[row, col] = EMPTY
+                newMap[row + 1, col - 1] = SAND
+                moved = True
+            elif self.is_cell(right_cell, EMPTY) and self.is_cell(right_below_cell, EMPTY):
+                newMap[row, col] = EMPTY
+                newMap[row + 1, col + 1] = SAND
+                moved = True
+        return moved, newMap
+
+    @timed('step')
+    def calculate_next_state(self):
+        """
+        This method is the engine of the simulation. Calculates and updates the next state of the simulation following the rules.
+        if below cell is empty then move sand down.
+        if below cell is sand and left and below left cells are empty then move sand left-down
+        if below cell is sand and right and below right cells are empty then move sand right-down
+        The work is done by the engine selected with set_engine.
+        The simulation is finished when no grain moved or when the new state repeats a recent one (a cycle).
+        The map is stepped in place (the previous state is kept by the history) or, by the engines which need
+        the previous state while writing the next one, into the back buffer which is then swapped with it.
+        """
+        if not self.recent_hashes:
+            self.remember_state()
+        # flat indexes of the changed cells, the xor of the board hash and the number of moved grains, when known
+        changed = delta = moved = None
+        engine = self.choose_engine() if self.engine == AUTO_ENGINE else self.engine
+        if engine != SPARSE_ENGINE:
+            self.grains.invalidate()
+        if engine == SCALAR_ENGINE:
+            newMap = self.calculate_next_state_scalar()
+            # the scalar engine does not track chunks, so everything has to be checked again after it
+            self.chunks.wake_all()
+        elif engine == PARALLEL_ENGINE:
+            newMap, self.was_change = self.get_parallel_engine().step(self.map, out=self.back_buffer())
+            self.chunks.wake_all()
+        elif engine == SPARSE_ENGINE:
+            # the grains are moved in place, the old state is kept by the history
+            newMap, self.was_change = self.grains.step(self.map, in_place=True)
+            moves = self.grains.sources, self.grains.targets, self.grains.merged
+            changed, delta, moved = np.concatenate(moves), moves_hash(*moves), moves[0].size
+            # the chunks stay up to date for the dense engine
+            self.chunks.wake_cells(*np.divmod(moves[0], self.map.shape[1]))
+        elif engine == MATERIALS_ENGINE:
+            newMap, self.was_change = self.materials.step(self.map, in_place=True)
+            changed, moved = self.materials.changed, self.materials.moved
+            delta = changes_hash(changed, self.materials.before, newMap.ravel()[changed])
+            self.chunks.wake_cells(*np.divmod(changed, self.map.shape[1]))
+        else:
+            newMap, self.was_change = self.chunks.step(self.map, in_place=True)
+            moves = self.chunks.moved_cells()
+            changed, delta, moved = np.concatenate(moves), moves_hash(*moves), moves[0].size
+        flow, pending = self.apply_flow(newMap, engine)
+        if self.was_change:
+            self.steps += 1
+            if newMap is not self.map:
+                self.map, self.back = newMap, self.map
+            self.add_state(self.map, np.concatenate((changed,) + flow) if changed is not None else None)
+            STATS.tick('steps')
+            self.grains_moved = moved
+            if moved is not None:
+                STATS.record('grains_moved', moved)
+            if delta is not None and self.board_hash is not None:
+                self.board_hash ^= delta ^ moves_hash(*flow)
+            else:
+                self.board_hash = None
+            period = self.remember_state()
+            self.emit(STEP, self)
+            # a random emitter does not repeat its grains when the map repeats
+            if period is not None and not any(emitter.random for emitter in self.emitters):
+                self.finish(period)
+        elif pending:
+            # nothing changed, but the next masks of the emitters may add grains
+            self.steps += 1
+        else:
+            self.finish(1)
+
+    def apply_flow(self, grid, engine):
+        """Applies the sinks and the emitters to the stepped grid, see Flow.apply_flow.
+
+        :return: tuple ((removed, added) flat indexes, bool indicating if an emitter may still add grains).
+        """
+        empty = np.empty(0, dtype=np.intp)
+        if not self.emitters and not self.sinks:
+            return (empty, empty), False
+        removed, added, pending = apply_flow(grid, self.emitters, self.sinks, self.steps)
+        if removed.size or added.size:
+            self.was_change = True
+            self.chunks.wake_cells(*np.divmod(np.concatenate((removed, added)), grid.shape[1]))
+            if engine == SPARSE_ENGINE:
+                self.grains.update(grid, added)
+        return (removed, added), pending
+
+    @synchronized
+    def add_emitter(self, region, rate=1.0, seed=None):
+        """Adds an emitter of sand applied after every step, see Flow.Emitter.
+
+        :param region: (row_start, row_stop, col_start, col_stop) of the cells.
+        :param rate: probability that an empty cell of the region gets a grain in a step.
+        """
+        if rate < 1 and seed is None:
+            seed = int(np.random.default_rng().integers(2 ** 63))
+        emitter = Emitter(region, rate, seed)
+        self.log_event('add_emitter', region=list(emitter.region), rate=emitter.rate, seed=seed)
+        self.emitters.append(emitter)
+        self.edited()
+
+    @synchronized
+    def add_sink(self, region):
+        """Adds a sink removing the grains which reach the region, see Flow.Sink."""
+        sink = Sink(region)
+        self.log_event('add_sink', region=list(sink.region))
+        self.sinks.append(sink)
+        self.edited()
+
+    @synchronized
+    def clear_flow(self):
+        """Removes all the emitters and sinks."""
+        self.log_event('clear_flow')
+        self.emitters = []
+        self.sinks = []
+        self.edited()
+
+    def choose_engine(self):
+        """Engine for the next step of the 'auto' engine: 'sparse' when the grains take a small part of the map,
+        'materials' when the map has other movable materials than sand."""
+        if self.mixed is None:
+            self.mixed = self.materials.needed(self.map)
+        if self.mixed:
+            return MATERIALS_ENGINE
+        if self.grains.grains is not None:
+            # the list is known while the sparse engine is used, it is left only when the map gets much denser
+            if self.grains.grains.size <= 2 * SPARSE_DENSITY * self.map.size:
+                return SPARSE_ENGINE
+            return VECTORIZED_ENGINE
+        if self.density_check > 0:
+            self.density_check -= 1
+            return VECTORIZED_ENGINE
+        self.density_check = SPARSE_CHECK_INTERVAL
+        if np.count_nonzero(self.map == SAND) <= SPARSE_DENSITY * self.map.size:
+            return SPARSE_ENGINE
+        return VECTORIZED_ENGINE
+
+    def finish(self, period):
+        """Marks the simulation as finished with a cycle of the period (1 - nothing moves) and emits the event."""
+        self.finished = True
+        self.cycle_period = period
+        self.emit(END_OF_SIMULATION)
+
+    def remember_state(self):
+        """Records the hash of the newest state, returns the cycle period if the same state was seen recently."""
+        if self.board_hash is None:
+            self.board_hash = board_hash(self.map)
+        index = len(self.states) - 1
+        previous = self.recent_hashes.pop(self.board_hash, None)
+        self.recent_hashes[self.board_hash] = index
+        if len(self.recent_hashes) > CYCLE_WINDOW:
+            del self.recent_hashes[next(iter(self.recent_hashes))]
+        # the hash may collide, the states are compared when the older one is still in the history
+        if previous is not None and (previous < self.states.first_index or
+                                     np.array_equal(self.states[previous], self.map)):
+            return index - previous
+        return None
+
+    def edited(self):
+        """Forgets the hash and the recent states after the map was changed outside of the rules."""
+        self.board_hash = None
+        self.recent_hashes = {}
+        self.finished = False
+        self.cycle_period = None
+        self.grains.invalidate()
+        self.density_check = 0
+        self.mixed = None
+
+    def calculate_next_state_scalar(self):
+        """Reference engine visiting every cell, bottom-up and right-to-left."""
+        rows, cols = self.map.shape
+        newMap = self.back_buffer()
+        np.copyto(newMap, self.map)
+        # iterate from end.
+        self.was_change = False
+        for row in range(rows - 1, -1, -1):
+            for col in range(cols - 1, -1, -1):
+                cell = self.map[row, col]
+                if cell == SAND:
+                    moved, newMap = self.handleSandMoveFor(row, col, newMap)
+                    self.was_change = self.was_change or moved
+        return newMap
+
+    def back_buffer(self):
+        """Returns the back buffer of the map, allocated when the shape of the map changed."""
+        if self.back is None or self.back.shape != self.map.shape:
+            self.back = np.empty_like(self.map)
+        return self.back
+
+    @synchronized
+    def settle(self, max_steps=None):
+        """Fast-forwards the simulation to the state in which no grain moves.
+
+        The final map is the same as the one reached calling calculate_next_state until was_change is False.
+        The map is stepped in place, the intermediate states are not recorded and no event is emitted, only the
+        final state is added to the history. The emitters and sinks are not applied (with them the grains may
+        never stop). Sand-only maps are stepped visiting only the active chunks. Maps with other materials are
+        stepped by the materials engine; liquids may flow forever, so it also stops when a state repeats one of
+        the last CYCLE_WINDOW states, and after SETTLE_MIXED_STEPS steps when no limit is given.
+
+        :param max_steps: limit of steps, None means no limit for sand-only maps.
+        :return: number of steps in which some grain moved.
+        """
+        self.log_event('settle', max_steps=max_steps)
+        mixed = self.materials.needed(self.map)
+        if mixed and max_steps is None:
+            max_steps = SETTLE_MIXED_STEPS
+        state_hash = board_hash(self.map) if mixed else None
+        recent = {state_hash: 0} if mixed else None
+        period = None
+        steps = 0
+        self.was_change = True
+        while max_steps is None or steps < max_steps:
+            if mixed:
+                self.was_change = self.materials.step(self.map, in_place=True)[1]
+            else:
+                self.was_change = self.chunks.step(self.map, in_place=True)[1]
+            if not self.was_change:
+                break
+            steps += 1
+            if mixed:
+                changed = self.materials.changed
+                state_hash ^= changes_hash(changed, self.materials.before, self.map.ravel()[changed])
+                # the intermediate states are not kept, so the cycle is found by the hashes alone
+                previous = recent.pop(state_hash, None)
+                recent[state_hash] = steps
+                if len(recent) > CYCLE_WINDOW:
+                    del recent[next(iter(recent))]
+                if previous is not None:
+                    period = steps - previous
+                    break
+        if mixed:
+            self.chunks.wake_all()
+        if steps:
+            self.steps += steps
+            self.edited()
+            self.add_state(self.map)
+        self.finished = not self.was_change or period is not None
+        self.cycle_period = period if period is not None else 1 if self.finished else None
+        return steps
+
+    @synchronized
+    def read_from_file(self, filename):
+        """Loads the pattern (text or binary, see PatternIO) by name from the patterns directory or by path."""
+        try:
+            grid = PatternIO.load(os.path.join(DISHES_DIR, filename))
+            if grid is None:
+                return
+            self.load_map(grid, filename)
+            return True
+        except Exception:
+            return False
+
+    @synchronized
+    def load_map(self, grid, name, steps=0):
+        """Starts a new simulation from a copy of the grid. The name is used by reset and as initial_pattern.
+
+        :param steps: value of the step counter for the grid (when the simulation is continued).
+        """
+        self.steps = steps
+        self.rows, self.cols = grid.shape
+        self.map = np.array(grid, dtype=np.uint8)
+        self.chunks = ActiveChunks(self.map.shape, CHUNK_SIZE)
+        self.grains = SparseGrains()
+        self.init_states()
+        self.states.append(self.map)
+        self.initial_state = np.copy(self.map)
+        self.initial_pattern = name
+        self.input_log = InputLog(self.map, name, self.steps)
+        self.emitters = []
+        self.sinks = []
+        self.edited()
+
+    @synchronized
+    def get_checkpoint(self, history=False):
+        """Returns the state of the simulation as a dictionary of arrays, see Checkpoint.save_checkpoint.
+
+        :param history: include the stored history states, otherwise only the current map is restored.
+        """
+        generator = next(name for name, method in GENERATORS.items() if method == self.sandGenerator.__name__)
+        hashes = self.recent_hashes
+        checkpoint = {
+            'map': np.copy(self.map),
+            'initial_state': self.initial_state,
+            'initial_pattern': np.array(self.initial_pattern or ''),
+            'generator': np.array(generator),
+            'step': np.int64(len(self.states) - 1),
+            'steps': np.int64(self.steps),
+            'current_state': np.int64(self.current_state),
+            'was_change': np.bool_(self.was_change),
+            'finished': np.bool_(self.finished),
+            'cycle_period': np.int64(self.cycle_period or 0),
+            'board_hash': np.uint64(self.board_hash if self.board_hash is not None else 0),
+            'has_board_hash': np.bool_(self.board_hash is not None),
+            'recent_hashes': np.array(list(hashes), dtype=np.uint64),
+            'recent_indexes': np.array(list(hashes.values()), dtype=np.int64),
+            'flow': np.array(json.dumps([element.to_dict() for element in self.emitters + self.sinks])),
+        }
+        if history and self.history:
+            checkpoint.update({'history_' + key: value for key, value in self.states.pack().items()})
+        return checkpoint
+
+    @synchronized
+    def set_checkpoint(self, checkpoint):
+        """Restores the state of the simulation from a dictionary returned by get_checkpoint."""
+        self.load_map(checkpoint['map'], str(checkpoint['initial_pattern']) or None,
+                      int(checkpoint['steps']) if 'steps' in checkpoint else 0)
+        self.initial_state = np.asarray(checkpoint['initial_state'], dtype=np.uint8)
+        self.sandGenerator = self.get_generator(str(checkpoint['generator']))
+        step = int(checkpoint['step'])
+        if 'history_is_keyframe' in checkpoint and self.history:
+            self.states.unpack({key[len('history_'):]: value for key, value in checkpoint.items()
+                                if key.startswith('history_')})
+        else:
+            self.states.restart(self.map, step)
+        self.current_state = max(int(checkpoint['current_state']), self.states.first_index)
+        self.was_change = bool(checkpoint['was_change'])
+        self.finished = bool(checkpoint['finished'])
+        self.cycle_period = int(checkpoint['cycle_period']) or None
+        self.board_hash = int(checkpoint['board_hash']) if checkpoint['has_board_hash'] else None
+        self.recent_hashes = dict(zip(checkpoint['recent_hashes'].tolist(), checkpoint['recent_indexes'].tolist()))
+        flow = [from_dict(description) for description in json.loads(str(checkpoint.get('flow', '[]')))]
+        self.emitters = [element for element in flow if isinstance(element, Emitter)]
+        self.sinks = [element for element in flow if isinstance(element, Sink)]
+
+    @synchronized
+    def save_replay(self, path):
+        """Writes the input log of the simulation up to the current step, see Replay.Replayer."""
+        self.input_log.end_step = self.steps
+        self.input_log.save(path)
+
+    @synchronized
+    def save_to_file(self, filepath):
+        """Writes the current map in the text format of the patterns (x - wall, . - empty, o - sand)."""
+        PatternIO.save_text(self.map, filepath)
+
+    @synchronized
+    def get_state(self):
+        if self.unrecorded and self.current_state == len(self.states) - 1:
+            # the map was painted after the newest state was recorded
+            return self.map
+        return self.states[self.current_state]
+
+    @synchronized
+    def get_frame(self):
+        """Returns a copy of the current state which can be used outside of the lock."""
+        return np.copy(self.get_state())
+
+    @synchronized
+    def get_view(self, region=None, factor=1):
+        """Returns a copy of the part of the current state shown by the view, see SandEngine.downsample.
+
+        :param region: (row_start, row_stop, col_start, col_stop) of the cells, None means the whole map.
+        :param factor: number of cells (in each direction) shown as one pixel.
+        """
+        state = self.get_state()
+        if region is not None:
+            row_start, row_stop, col_start, col_stop = region
+            state = state[row_start:row_stop, col_start:col_stop]
+        return downsample(state, factor)
+
+    @timed('history')
+    def add_state(self, state, changed=None):
+        """Records the state in the history, the history keeps its own copy.
+
+        :param changed: flat indexes of the cells changed by the step since the previous state, when known; the
+            cells painted in the meantime (see stroke_to) are added to them.
+        """
+        if changed is not None and self.unrecorded:
+            changed = np.concatenate([changed] + self.unrecorded)
+        self.unrecorded = []
+        self.states.append(state, changed)
+        self.current_state = len(self.states) - 1
+        STATS.set_gauge('history_bytes', self.states.nbytes)
+        STATS.set_gauge('history_states', len(self.states) - self.states.first_index)
+
+    @synchronized
+    def set_cell(self, i, j, value):
+        self.log_event('set_cell', i=int(i), j=int(j), value=int(value))
+        self.map[i, j] = value
+        self.chunks.wake(i, i + 1, j, j + 1)
+        self.edited()
+        self.add_state(self.map)
+
+    @synchronized
+    def begin_stroke(self, value, radius=0):
+        """Starts a brush stroke painting cells with the value, see stroke_to and end_stroke.
+
+        :param radius: radius of the round brush in cells, 0 paints single cells.
+        """
+        self.log_event('begin_stroke', value=int(value), radius=int(radius))
+        offsets = np.arange(-radius, radius + 1)
+        rows, cols = np.meshgrid(offsets, offsets, indexing='ij')
+        inside = rows ** 2 + cols ** 2 <= radius ** 2
+        self.stroke = {'value': value, 'brush': (rows[inside], cols[inside]), 'last': None, 'painted': False}
+
+    @synchronized
+    def stroke_to(self, row, col):
+        """Paints the line from the previous point of the stroke to (row, col) in one write.
+
+        The painted cells are recorded in the history with the next state, see add_state.
+        """
+        if self.stroke is None:
+            return
+        self.log_event('stroke_to', row=int(row), col=int(col))
+        last = self.stroke['last'] or (row, col)
+        self.stroke['last'] = (row, col)
+        count = max(abs(row - last[0]), abs(col - last[1])) + 1
+        line_rows = np.rint(np.linspace(last[0], row, count)).astype(np.intp)
+        line_cols = np.rint(np.linspace(last[1], col, count)).astype(np.intp)
+        brush_rows, brush_cols = self.stroke['brush']
+        rows = (line_rows[:, None] + brush_rows).ravel()
+        cols = (line_cols[:, None] + brush_cols).ravel()
+        inside = (rows >= 0) & (rows < self.map.shape[0]) & (cols >= 0) & (cols < self.map.shape[1])
+        rows, cols = rows[inside], cols[inside]
+        self.map[rows, cols] = self.stroke['value']
+        self.unrecorded.append(rows * self.map.shape[1] + cols)
+        self.chunks.wake_cells(rows, cols)
+        self.edited()
+        self.stroke['painted'] = True
+
+    @synchronized
+    def end_stroke(self):
+        """Finishes the stroke recording one state in the history."""
+        if self.stroke is not None:
+            self.log_event('end_stroke')
+        if self.stroke is not None and self.stroke['painted']:
+            self.add_state(self.map)
+        self.stroke = None
@@ -0,0 +1,124 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import queue
+import threading
+from timeit import default_timer as timer
+
+from PyQt5.QtCore import QThread
+
+from SandModel import STEP_UNLOCKED
+
+
+class SimulationWorker(QThread):
+    """
+    Thread stepping the model independently of the view.
+
+    Frames are put into a small bounded queue. While the queue is full no frame is produced (the view would drop
+    it anyway), so the simulation never waits for the view. The view takes only the newest frame (latest_frame).
+    A frame is the part of the map selected by view (see SandModel.get_view), or the whole map.
+    After every step the model emits STEP_UNLOCKED outside the lock, e.g. for the exporters to wait there.
+
+    Attributes:
+        model           reference to an object of class FallingSand (the model)
+        frames          queue of frames (copies of the model state) waiting to be shown
+        step_period     minimal time between two steps in seconds, 0 means as fast as possible
+        view            (region, factor) of the frames set by the view, None for whole map frames
+        playing         event set when the simulation is going
+    """
+
+    def __init__(self, model, queue_size, step_period=0.1):
+        super().__init__()
+        self.model = model
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.step_period = step_period
+        self.view = None
+        self.playing = threading.Event()
+        self.stopping = False
+
+    def run(self):
+        """Main method of the thread: steps the model while playing."""
+        while not self.stopping:
+            if not self.playing.wait(0.1):
+                continue
+            start = timer()
+            view = self.view
+            frame = None
+            with self.model.lock:
+                self.model.next()
+                finished = self.model.finished
+                if finished or not self.frames.full():
+                    frame = self.model.get_view(*view) if view is not None else self.model.get_frame()
+            self.model.emit(STEP_UNLOCKED)
+            if frame is not None:
+                self.put_frame((view, frame))
+            if finished:
+                # the model emits endOfSimulationSignal, nothing more to calculate
+                self.playing.clear()
+                continue
+            remaining = self.step_period - (timer() - start)
+            if remaining > 0:
+                self.msleep(int(remaining * 1000))
+
+    def put_frame(self, frame):
+        """Puts the (view, frame) pair into the queue dropping the oldest one when the queue is full."""
+        while True:
+            try:
+                self.frames.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def latest_frame(self):
+        """Returns the newest produced (view, frame) pair (dropping the older ones) or None if there is no new frame."""
+        frame = None
+        while True:
+            try:
+                frame = self.frames.get_nowait()
+            except queue.Empty:
+                return frame
+
+    def set_steps_per_second(self, steps_per_second):
+        """Setter for the simulation speed, 0 means as fast as possible."""
+        self.step_period = 1 / steps_per_second if steps_per_second > 0 else 0
+
+    def resume(self):
+        # frames produced before the pause may be older than the edits made during it
+        self.latest_frame()
+        self.playing.set()
+
+    def pause(self):
+        self.playing.clear()
+
+    def is_playing(self):
+        return self.playing.is_set()
+
+    def stop(self):
+        """Stops the thread and waits until it finishes."""
+        self.stopping = True
+        self.playing.clear()
+        self.wait()
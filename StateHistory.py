@@ -0,0 +1,210 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+History of the simulation states kept within a memory budget.
+
+Every few states a whole keyframe is stored (zlib compressed), the states in between are stored as the
+list of cells which differ from the previous state. The oldest states are evicted together with their
+keyframe when the budget is exceeded. A history which does not record keeps only a reference to the newest
+state, without copying it.
+"""
+
+import zlib
+from collections import deque
+
+import numpy as np
+
+
+class StateHistory:
+    """
+    Sequence of map states with keyframes and sparse diffs.
+
+    States are addressed with absolute indexes: the first appended state has index 0 and indexes do not change
+    when old states are evicted. len() returns the index following the last state, first_index the oldest
+    state still available. Negative indexes count from the end like in a list.
+
+    Attributes:
+        keyframe_interval   number of states between two keyframes
+        memory_budget       maximal number of bytes used by the stored states
+        record              False when only the newest state is available (it is not copied, so it is the array
+                            passed to append and changes with it)
+        first_index         index of the oldest available state
+        nbytes              number of bytes used by the stored states
+    """
+
+    def __init__(self, keyframe_interval, memory_budget, record=True):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.memory_budget = memory_budget
+        self.record = record
+        self.clear()
+
+    def clear(self):
+        self.entries = deque()
+        self.first_index = 0
+        self.nbytes = 0
+        self.last = None
+        self.since_keyframe = 0
+        self.cache_index = None
+        self.cache = None
+
+    def restart(self, state, index):
+        """Clears the history and stores the state with the given index as the only one."""
+        self.clear()
+        self.first_index = index
+        self.append(state)
+
+    def __len__(self):
+        if not self.record:
+            return self.first_index + (self.last is not None)
+        return self.first_index + len(self.entries)
+
+    def append(self, state, changed=None):
+        """Stores a copy of the state as the newest one.
+
+        :param changed: flat indexes (may repeat) of all the cells which differ from the previous state, when
+            known; otherwise the states are compared.
+        """
+        if not self.record:
+            if self.last is not None:
+                self.first_index += 1
+            self.last = state
+            return
+        new_shape = self.last is None or self.last.shape != state.shape
+        if new_shape or self.since_keyframe + 1 >= self.keyframe_interval:
+            entry = self.keyframe(state)
+        else:
+            if changed is None:
+                changed = np.flatnonzero(self.last != state)
+            if changed.size * 5 >= state.size:
+                # the diff would not be smaller than the state itself
+                entry = self.keyframe(state)
+            else:
+                entry = (changed.astype(np.int32), state.ravel()[changed])
+                self.since_keyframe += 1
+        self.entries.append(entry)
+        self.nbytes += self.entry_nbytes(entry)
+        if new_shape:
+            self.last = np.copy(state)
+        elif changed is not None:
+            self.last.ravel()[changed] = state.ravel()[changed]
+        else:
+            np.copyto(self.last, state)
+        self.evict()
+
+    def keyframe(self, state):
+        self.since_keyframe = 0
+        return zlib.compress(np.ascontiguousarray(state).tobytes(), 1), state.shape, state.dtype
+
+    @staticmethod
+    def is_keyframe(entry):
+        return isinstance(entry[0], bytes)
+
+    def entry_nbytes(self, entry):
+        if self.is_keyframe(entry):
+            return len(entry[0])
+        return entry[0].nbytes + entry[1].nbytes
+
+    def evict(self):
+        """Removes the oldest keyframe together with its diffs while the budget is exceeded."""
+        while self.nbytes > self.memory_budget:
+            # find the next keyframe, the newest group is never evicted
+            next_keyframe = next((i for i in range(1, len(self.entries)) if self.is_keyframe(self.entries[i])), None)
+            if next_keyframe is None:
+                return
+            for _ in range(next_keyframe):
+                self.nbytes -= self.entry_nbytes(self.entries.popleft())
+            self.first_index += next_keyframe
+            if self.cache_index is not None and self.cache_index < self.first_index:
+                self.cache_index = self.cache = None
+
+    def __getitem__(self, index):
+        """Returns the state with the given index. The returned array must not be modified."""
+        if index < 0:
+            index += len(self)
+        if not self.first_index <= index < len(self):
+            raise IndexError(f'state {index} is not available in the history')
+        if index == len(self) - 1:
+            return self.last
+        return self.rebuild(index)
+
+    def rebuild(self, index):
+        """Rebuilds the state from the nearest keyframe (or the recently rebuilt state) and the diffs after it."""
+        position = index - self.first_index
+        start = position
+        while not self.is_keyframe(self.entries[start]):
+            start -= 1
+        cached = self.cache_index - self.first_index if self.cache_index is not None else None
+        if cached is not None and start <= cached <= position:
+            # continue from the recently rebuilt state instead of the keyframe
+            state = self.cache.copy()
+            start = cached + 1
+        else:
+            data, shape, dtype = self.entries[start]
+            state = np.frombuffer(zlib.decompress(data), dtype=dtype).reshape(shape).copy()
+            start += 1
+        for i in range(start, position + 1):
+            changed, values = self.entries[i]
+            state.ravel()[changed] = values
+        self.cache_index = index
+        self.cache = state
+        return state
+
+    def pack(self):
+        """Returns the stored entries as a dictionary of arrays (see unpack), e.g. for numpy.savez."""
+        keyframes = [entry for entry in self.entries if self.is_keyframe(entry)]
+        diffs = [entry for entry in self.entries if not self.is_keyframe(entry)]
+        return {
+            'first_index': np.int64(self.first_index),
+            'since_keyframe': np.int64(self.since_keyframe),
+            'is_keyframe': np.array([self.is_keyframe(entry) for entry in self.entries], dtype=bool),
+            'keyframe_data': np.frombuffer(b''.join(entry[0] for entry in keyframes), dtype=np.uint8),
+            'keyframe_sizes': np.array([len(entry[0]) for entry in keyframes], dtype=np.int64),
+            'keyframe_shapes': np.array([entry[1] for entry in keyframes], dtype=np.int64).reshape(-1, 2),
+            'diff_changed': np.concatenate([entry[0] for entry in diffs] or [np.empty(0, np.int32)]),
+            'diff_values': np.concatenate([entry[1] for entry in diffs] or [np.empty(0, np.uint8)]),
+            'diff_sizes': np.array([entry[0].size for entry in diffs], dtype=np.int64),
+        }
+
+    def unpack(self, arrays):
+        """Replaces the stored entries with the ones packed by pack."""
+        self.clear()
+        keyframes = iter(zip(np.split(arrays['keyframe_data'], np.cumsum(arrays['keyframe_sizes'])[:-1]),
+                             arrays['keyframe_shapes']))
+        diff_splits = np.cumsum(arrays['diff_sizes'])[:-1]
+        diffs = iter(zip(np.split(arrays['diff_changed'], diff_splits), np.split(arrays['diff_values'], diff_splits)))
+        for is_keyframe in arrays['is_keyframe']:
+            if is_keyframe:
+                data, shape = next(keyframes)
+                entry = (data.tobytes(), tuple(int(n) for n in shape), np.dtype(np.uint8))
+            else:
+                changed, values = next(diffs)
+                entry = (changed.copy(), values.copy())
+            self.entries.append(entry)
+            self.nbytes += self.entry_nbytes(entry)
+        self.first_index = int(arrays['first_index'])
+        self.since_keyframe = int(arrays['since_keyframe'])
+        if self.entries:
+            self.last = np.copy(self.rebuild(len(self) - 1))
+        self.evict()
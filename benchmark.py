@@ -0,0 +1,221 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Benchmark suite of the simulation engine, pattern loading and rendering.
+
+Reports steps per second, time to settle and peak memory for the shipped patterns and for generated maps
+of several sizes and sand densities. Results are written as JSON so that runs can be compared.
+
+Example:
+    python benchmark.py --output bench.json
+    python benchmark.py --sizes 100 1000 --densities 0.1 0.5 --steps 50 --settle --render
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from timeit import default_timer as timer
+
+import numpy as np
+
+import PatternIO
+from SandEngine import ENGINES, SAND, step_vectorized
+from SandModel import SandModel, random_map
+from settings import DEFAULT_ENGINE, DISHES_DIR
+
+SHIPPED_PATTERNS = ('bowl', 'small_bowl', 'middleBow', 'empty')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the falling sand simulation.')
+    parser.add_argument('--patterns', nargs='*', default=list(SHIPPED_PATTERNS), help='patterns to benchmark')
+    parser.add_argument('--sizes', nargs='*', type=int, default=[100, 500, 1000, 2000, 4000],
+                        help='sides of the generated square maps')
+    parser.add_argument('--densities', nargs='*', type=float, default=[0.1, 0.3, 0.5],
+                        help='sand densities of the generated maps')
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument('--steps', type=int, default=100, help='steps measured for steps per second')
+    parser.add_argument('--memory-steps', type=int, default=10, help='steps measured for the peak memory')
+    parser.add_argument('--settle', action='store_true', help='measure the time to settle as well')
+    parser.add_argument('--max-settle-steps', type=int, default=20000)
+    parser.add_argument('--load-repeat', type=int, default=5, help='repetitions of the pattern loading benchmark')
+    parser.add_argument('--render', action='store_true', help='run the offscreen rendering benchmark (needs PyQt5)')
+    parser.add_argument('--render-frames', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file for the results (printed to stdout when not given)')
+    return parser.parse_args(argv)
+
+
+def run_steps(model, steps):
+    """Steps the model at most steps times, returns (steps done, seconds)."""
+    done = 0
+    start = timer()
+    for _ in range(steps):
+        model.next()
+        done += 1
+        if not model.was_change:
+            break
+    return done, timer() - start
+
+
+def bench_engine(name, grid, args):
+    """Steps per second, peak memory and optionally time to settle for one map."""
+    model = SandModel(engine=args.engine, pattern=None)
+    model.load_map(grid, name)
+    steps, seconds = run_steps(model, args.steps)
+    result = {
+        'name': name,
+        'shape': list(grid.shape),
+        'grains': int(np.count_nonzero(grid == SAND)),
+        'steps': steps,
+        'seconds': seconds,
+        'steps_per_second': steps / seconds if seconds > 0 else None,
+    }
+
+    model.reset()
+    tracemalloc.start()
+    run_steps(model, args.memory_steps)
+    result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    if args.settle:
+        model.reset()
+        steps, seconds = run_steps(model, args.max_settle_steps)
+        result['settled'] = not model.was_change
+        result['settle_steps'] = steps
+        result['time_to_settle'] = seconds if not model.was_change else None
+    return result
+
+
+def bench_loading(patterns, repeat):
+    """Time of SandModel.read_from_file for every pattern."""
+    results = []
+    model = SandModel(pattern=None)
+    for pattern in patterns:
+        times = []
+        for _ in range(repeat):
+            start = timer()
+            loaded = model.read_from_file(pattern)
+            times.append(timer() - start)
+        results.append({
+            'name': pattern,
+            'loaded': bool(loaded),
+            'file': os.path.basename(PatternIO.resolve(os.path.join(DISHES_DIR, pattern))),
+            'file_size': os.path.getsize(PatternIO.resolve(os.path.join(DISHES_DIR, pattern))),
+            'min_seconds': min(times),
+            'mean_seconds': sum(times) / len(times),
+        })
+    return results
+
+
+def bench_render(grids, frames):
+    """Cost of converting a frame to a scaled QPixmap and of a MapViewer update with repaint, offscreen."""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QPixmap
+    from PyQt5.QtWidgets import QApplication
+    from MapViewer import MapViewer
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841, needed by the widgets
+    viewer = MapViewer()
+    viewer.resize(800, 600)
+    viewer.show()
+    results = []
+    for name, grid in grids:
+        to_image = from_image = scale = 0
+        for _ in range(frames):
+            start = timer()
+            image = viewer.toQImage(grid)
+            to_image += timer() - start
+            start = timer()
+            pixmap = QPixmap.fromImage(image)
+            from_image += timer() - start
+            start = timer()
+            pixmap.scaled(viewer.size(), Qt.KeepAspectRatio, Qt.FastTransformation)
+            scale += timer() - start
+        total = to_image + from_image + scale
+        # the view is updated with two alternating frames, so every update repaints the moved grains
+        moved = step_vectorized(grid)[0]
+        start = timer()
+        for frame in range(frames):
+            viewer.updateView(moved if frame % 2 else grid)
+            viewer.repaint()
+        view = timer() - start
+        results.append({
+            'name': name,
+            'shape': list(grid.shape),
+            'frames': frames,
+            'to_qimage_seconds': to_image / frames,
+            'from_image_seconds': from_image / frames,
+            'scaled_seconds': scale / frames,
+            'frames_per_second': frames / total if total > 0 else None,
+            'view_update_seconds': view / frames,
+            'view_frames_per_second': frames / view if view > 0 else None,
+        })
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    grids = []
+    loader = SandModel(pattern=None)
+    for pattern in args.patterns:
+        if loader.read_from_file(pattern):
+            loader.topEdgeGenerator()
+            grids.append((pattern, np.copy(loader.map)))
+        else:
+            print(f"Pattern '{pattern}' could not be loaded", file=sys.stderr)
+    for size in args.sizes:
+        for density in args.densities:
+            grids.append((f'random_{size}x{size}_{density}', random_map(size, size, density, args.seed)))
+
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'engine': args.engine,
+        'engine_results': [],
+        'loading_results': bench_loading(args.patterns, args.load_repeat),
+    }
+    for name, grid in grids:
+        result = bench_engine(name, grid, args)
+        results['engine_results'].append(result)
+        print(f"{name}: {result['steps_per_second'] or 0:.1f} steps/s", file=sys.stderr)
+    if args.render:
+        results['render_results'] = bench_render(grids, args.render_frames)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
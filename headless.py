@@ -0,0 +1,319 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Command line entry point running the simulation without PyQt.
+
+Example:
+    python headless.py small_bowl --generator top --until-settled --output final.npy --stats stats.json
+    python headless.py bowl --generator top --steps 5000 --export run.gif --export-every 10
+    python headless.py bowl --generator top --checkpoint run.ckpt.npz --checkpoint-every 1000
+    python headless.py --resume run.ckpt.npz --checkpoint run.ckpt.npz --checkpoint-every 1000
+    python headless.py huge.npy --generator top --packed --output final.npy
+    python headless.py --replay bug.replay.npz --output final.npy
+    python headless.py bowl --generator top --steps 100000 --serve 127.0.0.1:8765 --no-history
+    python headless.py empty --emitter 0 3 80 96 0.5 --sink 100 101 0 176 --steps 10000 --no-history
+"""
+
+import argparse
+import json
+import os
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+
+from Checkpoint import CheckpointWriter, load_checkpoint, save_checkpoint
+from FrameExporter import exporter_for
+from FrameStream import FrameServer
+from InputLog import InputLog
+from Instrumentation import STATS
+import PatternIO
+from PackedBoard import PackedBoard
+from Replay import Replayer
+from SandEngine import ENGINES, AUTO_ENGINE, MATERIALS_ENGINE
+from SandModel import SandModel, GENERATORS, generator_region
+from StateHistory import StateHistory
+from settings import DEFAULT_ENGINE, DISHES_DIR, HISTORY_KEYFRAME_INTERVAL, HISTORY_MEMORY_BUDGET
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the falling sand simulation without GUI.')
+    parser.add_argument('pattern', nargs='?',
+                        help='name of a pattern from the patterns directory or path to a pattern file')
+    parser.add_argument('--resume', help='continue the simulation saved in the checkpoint file instead of a pattern')
+    parser.add_argument('--replay', help='reproduce the simulation recorded in the replay file (to its end or --steps)')
+    parser.add_argument('--generator', choices=tuple(GENERATORS), help='sand generator applied before the first step')
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument('--emitter', nargs=5, type=float, action='append', default=[],
+                        metavar=('ROW_START', 'ROW_STOP', 'COL_START', 'COL_STOP', 'RATE'),
+                        help='region in which sand appears after every step, each empty cell with the RATE probability')
+    parser.add_argument('--sink', nargs=4, type=int, action='append', default=[],
+                        metavar=('ROW_START', 'ROW_STOP', 'COL_START', 'COL_STOP'),
+                        help='region in which the grains disappear')
+    parser.add_argument('--flow-seed', type=int, help='seed of the random emitters (a random one by default)')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--steps', type=int, help='number of steps to run (stops earlier when the map is settled)')
+    group.add_argument('--until-settled', action='store_true', help='run until no grain moves (default)')
+    group.add_argument('--settle', action='store_true',
+                       help='fast-forward to the settled state without recording the intermediate states')
+    parser.add_argument('--packed', action='store_true',
+                        help='step the map stored with 2 bits per cell (see PackedBoard), for very large maps')
+    parser.add_argument('--max-steps', type=int, default=1000000,
+                        help='limit of steps for --until-settled and --settle')
+    parser.add_argument('--output', help='file for the final map: .npy or the text pattern format')
+    parser.add_argument('--export', help='records the run: .gif, .npz or a directory for a PNG sequence')
+    parser.add_argument('--export-every', type=int, default=1, help='records only every n-th frame')
+    parser.add_argument('--serve', metavar='ADDRESS',
+                        help="streams the frames to FrameStream.py clients on 'host:port' or a Unix socket path")
+    parser.add_argument('--serve-every', type=int, default=1, help='streams only every n-th step')
+    parser.add_argument('--checkpoint', help='file for the checkpoints, also written at the end of the run')
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help='steps between two checkpoints')
+    parser.add_argument('--no-history', action='store_true',
+                        help='keep only the current state, without the history of the previous ones')
+    parser.add_argument('--checkpoint-history', action='store_true', help='include the history in the checkpoints')
+    parser.add_argument('--profile', type=int, metavar='STEPS', help='profile the first STEPS steps with cProfile')
+    parser.add_argument('--profile-output', default='steps.prof', help='file for the --profile statistics')
+    parser.add_argument('--record-replay', metavar='PATH', help='file for the input log of the run, see --replay')
+    parser.add_argument('--stats', help='JSON file for the timing statistics (printed to stdout when not given)')
+    args = parser.parse_args(argv)
+    if [args.pattern, args.resume, args.replay].count(None) != 2:
+        parser.error('one of a pattern, --resume or --replay is required')
+    if args.replay and (args.settle or args.until_settled or args.packed):
+        parser.error('--replay runs to the end of the recording or --steps')
+    if args.no_history and args.checkpoint_history:
+        parser.error('--checkpoint-history needs the history, it cannot be used with --no-history')
+    if args.packed and (args.resume or args.settle or args.checkpoint or args.emitter or args.sink or args.serve or
+                        args.record_replay or args.profile):
+        parser.error('--packed cannot be used with --resume, --settle, --checkpoint, --emitter, --sink, --serve, '
+                     '--record-replay or --profile')
+    return args
+
+
+def run(model, steps):
+    """Steps the model at most steps times or until it is settled.
+
+    :return: dictionary of timing statistics.
+    """
+    step_times = []
+    start = timer()
+    for _ in range(steps):
+        step_start = timer()
+        model.next()
+        step_times.append(timer() - step_start)
+        if model.finished:
+            break
+    total = timer() - start
+    return {
+        'steps': len(step_times),
+        'settled': not model.was_change,
+        'cycle_period': model.cycle_period,
+        'total_time': total,
+        'steps_per_second': len(step_times) / total if total > 0 else None,
+        'mean_step_time': float(np.mean(step_times)) if step_times else None,
+        'max_step_time': max(step_times, default=None),
+    }
+
+
+def load_packed(pattern, generator=None):
+    """Loads the pattern straight into a PackedBoard, the uint8 map is not kept.
+
+    Binary patterns are packed from their memory map; the map is copied only when the generator fills a part of it.
+    """
+    grid = PatternIO.load(os.path.join(DISHES_DIR, pattern))
+    if grid is None:
+        raise ValueError(f"pattern '{pattern}' is empty")
+    if generator:
+        grid = np.array(grid)
+        rows, cols = generator_region(generator, grid.shape)
+        grid[rows, cols] = SandModel.generate_sand(grid[rows, cols])
+    return PackedBoard.from_grid(grid)
+
+
+def run_packed(board, steps, exporter=None, history=True):
+    """Steps the packed board in place, with the history of the packed states.
+
+    :param history: keep the previous states, otherwise only the current one (see --no-history).
+    :return: dictionary of timing statistics.
+    """
+    history = StateHistory(HISTORY_KEYFRAME_INTERVAL, HISTORY_MEMORY_BUDGET, record=history)
+    history.append(board.state())
+    step_times = []
+    moved = True
+    start = timer()
+    while moved and len(step_times) < steps:
+        step_start = timer()
+        moved = board.step()
+        step_times.append(timer() - step_start)
+        if moved:
+            history.append(board.state())
+            if exporter is not None:
+                exporter.write(board.to_grid())
+    total = timer() - start
+    return {
+        'steps': len(step_times),
+        'settled': not moved,
+        'total_time': total,
+        'steps_per_second': len(step_times) / total if total > 0 else None,
+        'mean_step_time': float(np.mean(step_times)) if step_times else None,
+        'max_step_time': max(step_times, default=None),
+        'step': len(history) - 1,
+        'board_bytes': board.nbytes,
+        'history_states': len(history) - history.first_index,
+        'history_bytes': history.nbytes,
+    }
+
+
+def main_packed(args):
+    """Runs the pattern as a PackedBoard, without the uint8 map and the history of a SandModel."""
+    start = timer()
+    try:
+        board = load_packed(args.pattern, args.generator)
+    except Exception as error:
+        print(f"Pattern '{args.pattern}' could not be loaded as a packed board: {error}", file=sys.stderr)
+        return 1
+    load_time = timer() - start
+    exporter = None
+    if args.export:
+        exporter = exporter_for(args.export, every=args.export_every)
+        exporter.write(board.to_grid())
+    stats = run_packed(board, args.steps if args.steps is not None else args.max_steps, exporter,
+                       history=not args.no_history)
+    if exporter is not None:
+        exporter.close()
+        stats['exported_frames'] = exporter.written
+    stats.update({
+        'pattern': args.pattern,
+        'generator': args.generator,
+        'engine': 'packed',
+        'shape': list(board.shape),
+        'load_time': load_time,
+        'instrumentation': STATS.snapshot(),
+    })
+    if args.output:
+        save_output(board.to_grid(), args.output)
+    save_stats(stats, args.stats)
+    return 0
+
+
+def save_output(grid, path):
+    """Writes the final map as .npy or in the text pattern format."""
+    if os.path.splitext(path)[1] == '.npy':
+        np.save(path, grid)
+    else:
+        PatternIO.save_text(grid, path)
+
+
+def save_stats(stats, path):
+    """Writes the statistics as JSON into the file, or to stdout when path is None."""
+    if path:
+        with open(path, 'w') as file:
+            json.dump(stats, file, indent=2)
+    else:
+        print(json.dumps(stats, indent=2))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.packed:
+        return main_packed(args)
+    start = timer()
+    model = SandModel(engine=args.engine, pattern=None, history=not args.no_history)
+    replayer = None
+    if args.resume:
+        load_checkpoint(model, args.resume)
+    elif args.replay:
+        replayer = Replayer(InputLog.load(args.replay), model=model)
+    elif not model.read_from_file(args.pattern):
+        print(f"Pattern '{args.pattern}' could not be loaded", file=sys.stderr)
+        return 1
+    load_time = timer() - start
+    if args.generator:
+        model.get_generator(args.generator)()
+    if model.materials.needed(model.map) and args.engine not in (AUTO_ENGINE, MATERIALS_ENGINE):
+        print(f"warning: the '{args.engine}' engine treats the other materials of the map as walls, "
+              f"use '{AUTO_ENGINE}' or '{MATERIALS_ENGINE}' to move them", file=sys.stderr)
+    for index, (row_start, row_stop, col_start, col_stop, rate) in enumerate(args.emitter):
+        seed = args.flow_seed + index if args.flow_seed is not None else None
+        model.add_emitter((int(row_start), int(row_stop), int(col_start), int(col_stop)), rate, seed)
+    for region in args.sink:
+        model.add_sink(region)
+    exporter = None
+    if args.export:
+        exporter = exporter_for(args.export, every=args.export_every)
+        exporter.attach(model)
+    server = None
+    if args.serve:
+        server = FrameServer(args.serve, every=args.serve_every).start()
+        server.attach(model)
+        print(f'serving frames on {server.bound_address}', file=sys.stderr)
+    if args.checkpoint:
+        CheckpointWriter(args.checkpoint, args.checkpoint_every, args.checkpoint_history).attach(model)
+    if args.profile:
+        STATS.profile_next(args.profile, args.profile_output)
+    if args.settle:
+        settle_start = timer()
+        steps = model.settle(args.max_steps)
+        if exporter is not None:
+            exporter.write(model.map)  # settle skips the intermediate states
+        stats = {'steps': steps, 'settled': not model.was_change, 'cycle_period': model.cycle_period,
+                 'total_time': timer() - settle_start}
+    elif replayer is not None:
+        replay_start = timer()
+        if args.steps is not None:
+            replayer.seek(args.steps)
+        else:
+            replayer.run()
+        stats = {'steps': model.steps, 'settled': not model.was_change, 'cycle_period': model.cycle_period,
+                 'total_time': timer() - replay_start}
+    else:
+        stats = run(model, args.steps if args.steps is not None else args.max_steps)
+    model.close()
+    if args.record_replay:
+        model.save_replay(args.record_replay)
+    if args.checkpoint:
+        save_checkpoint(model, args.checkpoint, args.checkpoint_history)
+    if exporter is not None:
+        exporter.close()
+        stats['exported_frames'] = exporter.written
+    if server is not None:
+        server.close()
+        stats['streamed_frames'] = server.sent
+    stats.update({
+        'pattern': model.initial_pattern,
+        'step': len(model.states) - 1,
+        'generator': args.generator,
+        'engine': args.engine,
+        'shape': list(model.map.shape),
+        'load_time': load_time,
+        'instrumentation': STATS.snapshot(),
+    })
+    if args.output:
+        save_output(model.map, args.output)
+    save_stats(stats, args.stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -28,6 +28,8 @@ from PyQt5.QtWidgets import QApplication  # pip install PyQt5
 from MainWindow import MainWindow
 from GolLoop import GolLoop
 from FallingSand import FallingSand
+from SimulationWorker import SimulationWorker
+from settings import DISPLAY_FPS, FRAME_QUEUE_SIZE
 
 qdark_present = True
 try:
@@ -41,9 +43,11 @@ if __name__ == '__main__':
     if qdark_present:
         app.setStyleSheet(qdarkstyle.load_stylesheet_pyqt5())
     model = FallingSand(mode='empty')  # The model
-    timer = GolLoop()  # The game loop
-    timer.timeout.connect(model.next)
+    worker = SimulationWorker(model, FRAME_QUEUE_SIZE)  # steps the model on its own thread
+    timer = GolLoop(worker, display_period=1000 // DISPLAY_FPS)  # The game loop, refreshes the view
     window = MainWindow(model, timer)  # The view controller / view (GUI)
 
     model.endOfSimulationSignal.connect(window.stopSimulation) #own signal connection.
+    app.aboutToQuit.connect(worker.stop)
+    worker.start()
     sys.exit(app.exec_())
@@ -26,3 +26,64 @@
 import os
 BASE_DIR =  os.path.dirname(os.path.realpath(__file__))
 DISHES_DIR = os.path.join(BASE_DIR, 'patterns')
+
+# engine used by FallingSand.calculate_next_state: 'auto' (switches between 'materials', 'vectorized' and
+# 'sparse'), 'vectorized', 'sparse', 'parallel', 'materials' (other materials than sand, see Materials.py)
+# or 'scalar' (reference implementation); only 'materials' and 'auto' move the other materials
+DEFAULT_ENGINE = 'auto'
+
+# side of the square map chunks in cells; only chunks with moving grains (and their neighbours) are stepped
+CHUNK_SIZE = 32
+
+# history of the simulation: a full (compressed) state every HISTORY_KEYFRAME_INTERVAL steps, changed cells in between.
+# The oldest states are dropped when the history takes more than HISTORY_MEMORY_BUDGET bytes.
+HISTORY_KEYFRAME_INTERVAL = 50
+HISTORY_MEMORY_BUDGET = 256 * 1024 * 1024
+
+# the view is refreshed DISPLAY_FPS times per second with the newest frame produced by the simulation worker,
+# at most FRAME_QUEUE_SIZE frames wait for the view, older ones are dropped
+DISPLAY_FPS = 60
+FRAME_QUEUE_SIZE = 2
+
+# number of processes of the 'parallel' engine, None means the number of CPUs
+PARALLEL_WORKERS = None
+
+# radius in cells of the brush painting walls with the mouse, 0 paints single cells
+BRUSH_RADIUS = 0
+
+# the simulation ends when a state repeats one of the last CYCLE_WINDOW states (grains moving in a cycle)
+CYCLE_WINDOW = 64
+
+# SandModel.settle stops maps with other materials than sand (liquids may flow forever) after at most
+# SETTLE_MIXED_STEPS steps when no limit is given
+SETTLE_MIXED_STEPS = 100000
+
+# frame exporters (FrameExporter.py) keep at most EXPORT_QUEUE_SIZE frames waiting for the writer thread
+EXPORT_QUEUE_SIZE = 8
+
+# the 'auto' engine moves only the listed grains (the 'sparse' engine) while at most SPARSE_DENSITY of the cells
+# are sand, otherwise it uses the 'vectorized' engine and counts the grains every SPARSE_CHECK_INTERVAL steps
+SPARSE_DENSITY = 0.01
+SPARSE_CHECK_INTERVAL = 16
+
+# hot paths are timed (see Instrumentation.py), the statistics are calculated from the last STATS_WINDOW values
+STATS_ENABLED = True
+STATS_WINDOW = 1000
+
+# the statistics overlay of the main window is refreshed every STATS_OVERLAY_PERIOD ms,
+# the profile button captures a cProfile profile of the next PROFILE_STEPS steps
+STATS_OVERLAY_PERIOD = 500
+PROFILE_STEPS = 100
+
+# one notch of the mouse wheel zooms the map view ZOOM_STEP times, at most until MIN_VISIBLE_CELLS cells are shown
+ZOOM_STEP = 1.25
+MIN_VISIBLE_CELLS = 16
+
+# the replay of an input log (see Replay.py) caches the state of every REPLAY_KEYFRAME_INTERVAL-th step
+REPLAY_KEYFRAME_INTERVAL = 100
+# the main window replays REPLAY_GUI_STEPS steps at a time, between them it handles the events and shows the map
+REPLAY_GUI_STEPS = 20
+
+# when a frame server (FrameStream.py) is closed, its clients get at most STREAM_CLOSE_TIMEOUT seconds
+# to take the last frame
+STREAM_CLOSE_TIMEOUT = 5
@@ -0,0 +1,263 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""
+Parameter sweep running the simulation headlessly for a grid of configurations in a pool of processes.
+
+Every combination of pattern, generator, scale, density and seed is run until the simulation ends (or
+--max-steps) and its metrics are written as one row of the report (.csv or .json). Rows are written as soon
+as a run finishes, so a sweep interrupted for any reason continues with the missing configurations when it is
+started again with the same report file. With --batch the configurations differing only by the seed are
+stepped together as one stack of boards (see BatchEngine), which is much faster for many small maps.
+
+Example:
+    python sweep.py --patterns bowl small_bowl --generators top central --scales 1 2 4 \\
+        --densities 0.5 1 --seeds 0 1 2 --output sweep.csv
+    python sweep.py --patterns small_bowl --generators top --densities 0.5 --seeds $(seq 0 499) --batch 500 \\
+        --output monte_carlo.csv
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from timeit import default_timer as timer
+
+import numpy as np
+
+from BatchEngine import SandBatch
+from SandEngine import ENGINES, SAND, EMPTY, SCALAR_ENGINE, PARALLEL_ENGINE
+from SandModel import SandModel, GENERATORS, STEP
+from settings import DEFAULT_ENGINE
+
+NO_GENERATOR = 'none'
+CONFIG_FIELDS = ('pattern', 'generator', 'scale', 'density', 'seed')
+METRIC_FIELDS = ('shape', 'grains', 'final_grains', 'steps', 'grains_moved', 'settled', 'cycle_period',
+                 'seconds', 'error')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the falling sand simulation for a grid of parameters.')
+    parser.add_argument('--patterns', nargs='+', default=['bowl', 'small_bowl', 'middleBow', 'empty'])
+    parser.add_argument('--generators', nargs='+', choices=tuple(GENERATORS) + (NO_GENERATOR,),
+                        default=list(GENERATORS))
+    parser.add_argument('--scales', nargs='+', type=int, default=[1],
+                        help='every cell of the pattern becomes a scale x scale square')
+    parser.add_argument('--densities', nargs='+', type=float, default=[1.0],
+                        help='probability of a grain in every cell filled by the generator')
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument('--max-steps', type=int, default=100000)
+    parser.add_argument('--batch', type=int, metavar='SIZE',
+                        help='step up to SIZE configurations differing only by the seed together in one array')
+    parser.add_argument('--workers', type=int, help='number of processes (the number of CPUs by default)')
+    parser.add_argument('--output', required=True, help='report file, .csv or .json; an existing one is resumed')
+    return parser.parse_args(argv)
+
+
+def configurations(args):
+    """All combinations of the sweep parameters as dictionaries."""
+    for values in itertools.product(args.patterns, args.generators, args.scales, args.densities, args.seeds):
+        yield dict(zip(CONFIG_FIELDS, values))
+
+
+def config_key(row):
+    """Key identifying the configuration of a report row, also of a row read back from a CSV file."""
+    return (row['pattern'], row['generator'], int(row['scale']), float(row['density']), int(row['seed']))
+
+
+def load_config(model, config):
+    """Loads the map of the configuration (pattern, scale and generated sand) into the model."""
+    if not model.read_from_file(config['pattern']):
+        raise ValueError(f"pattern '{config['pattern']}' could not be loaded")
+    scale = config['scale']
+    if scale > 1:
+        model.load_map(np.repeat(np.repeat(model.map, scale, axis=0), scale, axis=1), config['pattern'])
+    if config['generator'] != NO_GENERATOR:
+        model.get_generator(config['generator'])(config['density'], config['seed'])
+
+
+def run_config(config, engine=DEFAULT_ENGINE, max_steps=100000):
+    """Runs one configuration, returns the row of the report. Executed in the worker processes."""
+    row = dict(config)
+    model = None
+    try:
+        model = SandModel(engine=engine, pattern=None, history=False)
+        load_config(model, config)
+        grains = int(np.count_nonzero(model.map == SAND))
+        previous = np.copy(model.map) if engine in (SCALAR_ENGINE, PARALLEL_ENGINE) else None
+        moved = []
+
+        def count_moves(model):
+            if previous is None:
+                moved.append(model.grains_moved)
+                return
+            # the scalar and parallel engines do not count the moves: a grain leaves an empty cell behind
+            moved.append(np.count_nonzero((previous == SAND) & (model.map == EMPTY)))
+            np.copyto(previous, model.map)
+
+        model.subscribe(STEP, count_moves)
+        start = timer()
+        steps = 0
+        while steps < max_steps and not model.finished:
+            model.next()
+            steps += 1
+        row.update({
+            'seconds': timer() - start,
+            'shape': 'x'.join(map(str, model.map.shape)),
+            'grains': grains,
+            'final_grains': int(np.count_nonzero(model.map == SAND)),
+            'steps': len(moved),
+            'grains_moved': int(sum(moved)),
+            'settled': bool(model.finished and model.cycle_period == 1),
+            'cycle_period': model.cycle_period,
+            'error': '',
+        })
+    except Exception as error:
+        row['error'] = f'{type(error).__name__}: {error}'
+    finally:
+        if model is not None:
+            model.close()
+    return row
+
+
+def run_batch(configs, max_steps=100000):
+    """Runs configurations of maps of the same shape together in one SandBatch, returns the rows of the report.
+
+    The seconds of every row are the time of the whole batch divided by the number of its boards.
+    """
+    rows = [dict(config) for config in configs]
+    try:
+        model = SandModel(pattern=None, history=False)
+        boards = []
+        for config in configs:
+            load_config(model, config)
+            boards.append(np.copy(model.map))
+        model.close()
+        batch = SandBatch(boards)
+        grains = batch.count_sand()
+        start = timer()
+        batch.run(max_steps)
+        seconds = (timer() - start) / len(batch)
+        final_grains = batch.count_sand()
+        for index, row in enumerate(rows):
+            row.update({
+                'seconds': seconds,
+                'shape': 'x'.join(map(str, batch.boards.shape[1:])),
+                'grains': int(grains[index]),
+                'final_grains': int(final_grains[index]),
+                'steps': int(batch.steps[index]),
+                'grains_moved': int(batch.grains_moved[index]),
+                'settled': bool(batch.settled[index]),
+                'cycle_period': 1 if batch.settled[index] else None,
+                'error': '',
+            })
+    except Exception as error:
+        for row in rows:
+            row['error'] = f'{type(error).__name__}: {error}'
+    return rows
+
+
+def batches(configs, size):
+    """Splits the configurations into groups of at most size ones which differ only by the seed."""
+    groups = {}
+    for config in configs:
+        groups.setdefault(config_key(config)[:-1], []).append(config)
+    for group in groups.values():
+        for start in range(0, len(group), size):
+            yield group[start:start + size]
+
+
+def read_report(path):
+    """Rows of an existing report, an empty list when the file does not exist."""
+    if not os.path.exists(path):
+        return []
+    if os.path.splitext(path)[1] == '.json':
+        with open(path) as file:
+            return json.load(file)['results']
+    with open(path, newline='') as file:
+        return list(csv.DictReader(file))
+
+
+class Report:
+    """Report file to which the rows are written as soon as they are available."""
+
+    def __init__(self, path, rows):
+        self.path = path
+        self.rows = rows
+        self.json = os.path.splitext(path)[1] == '.json'
+        # the rows may differ from the file (e.g. the dropped rows of the failed configurations run again)
+        self.save()
+
+    def add(self, row):
+        self.rows.append(row)
+        if self.json:
+            self.save()
+        else:
+            with open(self.path, 'a', newline='') as file:
+                csv.DictWriter(file, CONFIG_FIELDS + METRIC_FIELDS).writerow(row)
+
+    def save(self):
+        """Writes all the rows. The whole report is replaced at once, so an interrupted write keeps the previous one."""
+        with open(self.path + '.tmp', 'w', newline='') as file:
+            if self.json:
+                json.dump({'results': self.rows}, file, indent=2)
+            else:
+                writer = csv.DictWriter(file, CONFIG_FIELDS + METRIC_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.rows)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows = read_report(args.output)
+    done = {config_key(row) for row in rows if not row.get('error')}
+    pending = [config for config in configurations(args) if config_key(config) not in done]
+    print(f'{len(done)} configurations done, {len(pending)} to run', file=sys.stderr)
+    # the failed configurations are run again, their new rows replace the rows with the errors
+    retried = {config_key(config) for config in pending}
+    rows = [row for row in rows if not (row.get('error') and config_key(row) in retried)]
+    report = Report(args.output, rows)
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        if args.batch:
+            futures = [executor.submit(run_batch, group, args.max_steps) for group in batches(pending, args.batch)]
+        else:
+            futures = [executor.submit(run_config, config, args.engine, args.max_steps) for config in pending]
+        number = 0
+        for future in as_completed(futures):
+            result = future.result()
+            for row in result if args.batch else [result]:
+                number += 1
+                report.add(row)
+                status = row['error'] or f"{row['steps']} steps, {row['seconds']:.2f} s"
+                print(f"[{number}/{len(pending)}] {config_key(row)}: {status}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,48 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import numpy as np
+import pytest
+
+from SandEngine import SAND, EMPTY, WALL, ActiveChunks, board_hash
+from SandModel import SandModel
+
+
+def random_board(seed, rows=40, cols=37, density=0.45):
+    rng = np.random.default_rng(seed)
+    grid = np.where(rng.random((rows, cols)) < density, SAND, EMPTY).astype(np.uint8)
+    grid[rng.random((rows, cols)) < 0.05] = WALL
+    return grid
+
+
+@pytest.mark.parametrize('engine', ['vectorized', 'sparse', 'auto'])
+@pytest.mark.parametrize('chunk_size', [2, 3, 8])
+@pytest.mark.parametrize('seed', range(3))
+def test_incremental_hash_matches_board_hash(engine, chunk_size, seed):
+    model = SandModel(engine=engine, pattern=None)
+    model.load_map(random_board(seed), 'random')
+    model.chunks = ActiveChunks(model.map.shape, chunk_size)
+    for _ in range(30):
+        model.next()
+        assert model.board_hash == board_hash(model.map)
@@ -0,0 +1,134 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+"""Every engine compared step by step with the scalar reference engine (SandModel.calculate_next_state_scalar)."""
+
+import numpy as np
+import pytest
+
+from BatchEngine import SandBatch
+from Materials import MaterialKernel
+from PackedBoard import PackedBoard
+from ParallelEngine import ParallelEngine
+from SandEngine import SAND, EMPTY, WALL, SCALAR_ENGINE, ActiveChunks, SparseGrains, find_moves, \
+    merged_targets, step_vectorized
+from SandModel import SandModel
+
+STEPS = 25
+
+# two grains slide into the same cell (row 1, column 2) in the first step, the other grains rest on the edges
+MERGING = np.array([
+    [SAND, SAND, EMPTY, SAND, SAND, EMPTY, EMPTY, SAND],
+    [SAND, SAND, EMPTY, SAND, EMPTY, EMPTY, SAND, SAND],
+    [WALL, WALL, WALL, WALL, EMPTY, SAND, SAND, SAND],
+], dtype=np.uint8)
+
+
+def random_board(seed, rows=23, cols=70, density=0.5):
+    """Sand and walls anywhere, also in the first and last rows and columns (the edges of the map)."""
+    rng = np.random.default_rng(seed)
+    grid = np.where(rng.random((rows, cols)) < density, SAND, EMPTY).astype(np.uint8)
+    grid[rng.random((rows, cols)) < 0.08] = WALL
+    return grid
+
+
+BOARDS = [MERGING] + [random_board(seed) for seed in range(3)] + [random_board(3, rows=9, cols=5, density=0.7)]
+
+
+def scalar_states(grid, steps=STEPS):
+    """States after each of the steps calculated by the scalar engine."""
+    model = SandModel(engine=SCALAR_ENGINE, pattern=None)
+    model.load_map(grid, 'board')
+    states = []
+    for _ in range(steps):
+        model.map = np.copy(model.calculate_next_state_scalar())
+        states.append(model.map)
+    return states
+
+
+def assert_steps(grid, step, steps=STEPS):
+    """Compares the states returned by step(grid) called repeatedly on its own result with the scalar ones."""
+    for number, expected in enumerate(scalar_states(grid, steps)):
+        grid = step(grid)
+        assert np.array_equal(grid, expected), f'the states differ after step {number + 1}'
+
+
+def test_boards_merge_slides():
+    fall, left, right = find_moves(MERGING)
+    assert merged_targets(MERGING, np.flatnonzero(right)).tolist() == [MERGING.shape[1] + 2]
+
+
+@pytest.mark.parametrize('grid', BOARDS)
+def test_vectorized(grid):
+    assert_steps(grid, lambda grid: step_vectorized(grid)[0])
+
+
+@pytest.mark.parametrize('in_place', [False, True])
+@pytest.mark.parametrize('chunk_size', range(2, 9))
+@pytest.mark.parametrize('grid', BOARDS)
+def test_chunked(grid, chunk_size, in_place):
+    chunks = ActiveChunks(grid.shape, chunk_size)
+    assert_steps(np.copy(grid), lambda grid: chunks.step(grid, in_place=in_place)[0])
+
+
+@pytest.mark.parametrize('grid', BOARDS)
+def test_sparse(grid):
+    grains = SparseGrains()
+    assert_steps(np.copy(grid), lambda grid: grains.step(grid, in_place=True)[0])
+
+
+@pytest.mark.parametrize('grid', BOARDS)
+def test_materials(grid):
+    kernel = MaterialKernel()
+    assert_steps(grid, lambda grid: kernel.step(grid)[0])
+
+
+@pytest.mark.parametrize('grid', BOARDS)
+def test_packed(grid):
+    board = PackedBoard.from_grid(grid)
+
+    def step(_):
+        board.step()
+        return board.to_grid()
+    assert_steps(grid, step)
+
+
+def test_batch():
+    boards = [grid for grid in BOARDS if grid.shape == BOARDS[1].shape]
+    batch = SandBatch(boards)
+    expected = [scalar_states(grid) for grid in boards]
+    for number in range(STEPS):
+        batch.step()
+        batch.sync()
+        for index, states in enumerate(expected):
+            assert np.array_equal(batch.boards[index], states[number]), f'board {index} after step {number + 1}'
+
+
+def test_parallel():
+    grid = BOARDS[1]
+    engine = ParallelEngine(grid.shape, workers=3)
+    try:
+        assert_steps(grid, lambda grid: engine.step(grid)[0], steps=10)
+    finally:
+        engine.close()
@@ -0,0 +1,72 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import threading
+
+import numpy as np
+
+from FrameExporter import FrameExporter
+from SandModel import SandModel, STEP_UNLOCKED, random_map
+
+
+class HeldExporter(FrameExporter):
+    """Keeps the frames in memory, the writer waits until released is set."""
+
+    def __init__(self, **kwargs):
+        self.released = threading.Event()
+        self.received = []
+        super().__init__(None, **kwargs)
+
+    def consume(self, frames):
+        self.released.wait()
+        self.received.extend(frames)
+
+
+def test_recording_does_not_wait_with_the_lock_held():
+    model = SandModel(pattern=None)
+    model.load_map(random_map(20, 30, 0.5, seed=0), 'random')
+    exporter = HeldExporter(queue_size=1)
+    exporter.attach(model)
+
+    def step():
+        # the same as SimulationWorker.run
+        for _ in range(5):
+            with model.lock:
+                model.next()
+            model.emit(STEP_UNLOCKED)
+
+    worker = threading.Thread(target=step, daemon=True)
+    worker.start()
+    try:
+        worker.join(0.5)
+        assert worker.is_alive()  # waits for the writer
+        assert model.lock.acquire(timeout=1)
+        model.lock.release()
+    finally:
+        exporter.released.set()
+    worker.join()
+    exporter.close()
+    assert len(exporter.received) == 6
+    for index, frame in enumerate(exporter.received):
+        assert np.array_equal(frame, model.states[index])
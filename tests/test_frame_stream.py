@@ -0,0 +1,81 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import os
+import threading
+import time
+import zlib
+
+import numpy as np
+import pytest
+
+from FrameStream import DELTA, KEYFRAME, LENGTH, FrameClient, FrameDecoder, FrameServer, encode_frame
+from SandEngine import SAND, EMPTY
+
+
+def message_kind(message):
+    return zlib.decompress(message[LENGTH.size:])[:1]
+
+
+def test_round_trip_of_keyframe_and_deltas():
+    rng = np.random.default_rng(0)
+    frame = np.where(rng.random((30, 41)) < 0.3, SAND, EMPTY).astype(np.uint8)
+    decoder = FrameDecoder()
+    previous = None
+    for step in range(6):
+        message = encode_frame(step, frame, previous)
+        assert message_kind(message) == (KEYFRAME if previous is None else DELTA)
+        decoded_step, decoded = decoder.decode(message[LENGTH.size:])
+        assert decoded_step == step and np.array_equal(decoded, frame)
+        previous = frame
+        frame = np.copy(frame)
+        # runs of changed cells, also at the first and the last cell
+        frame.ravel()[rng.integers(0, frame.size, 5)] = SAND
+        frame.ravel()[[0, -1]] = SAND if step % 2 else EMPTY
+    # a different shape needs a keyframe
+    assert message_kind(encode_frame(6, np.zeros((3, 3), dtype=np.uint8), previous)) == KEYFRAME
+
+
+def test_slow_client_gets_the_last_step(tmp_path):
+    if not hasattr(os, 'fork'):
+        pytest.skip('Unix sockets are needed')
+    server = FrameServer(str(tmp_path / 'frames.sock')).start()
+    with FrameClient(server.bound_address, timeout=10) as client:
+        while not server.clients:
+            time.sleep(0.01)
+        # frames which do not compress fill the socket buffers, the client falls behind
+        rng = np.random.default_rng(0)
+        for step in range(20):
+            server.write(rng.integers(0, 256, (1000, 1000), dtype=np.uint8), step)
+        # the server is closed while it waits for the client to take a frame
+        closing = threading.Thread(target=server.close)
+        closing.start()
+        time.sleep(0.2)
+        steps = []
+        for step, _ in client.frames():
+            steps.append(step)
+            time.sleep(0.05)
+        closing.join()
+    assert steps[-1] == 19
+    assert steps == sorted(steps) and len(steps) == server.sent
@@ -0,0 +1,50 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import json
+
+import numpy as np
+
+import PatternIO
+import headless
+from SandModel import random_map
+
+
+def run_headless(tmp_path, name, *options):
+    output, stats = str(tmp_path / f'{name}.npy'), str(tmp_path / f'{name}.json')
+    assert headless.main([str(tmp_path / 'pattern.npy'), '--generator', 'top', '--steps', '30',
+                          '--output', output, '--stats', stats] + list(options)) == 0
+    with open(stats) as file:
+        return np.load(output), json.load(file)
+
+
+def test_packed_run_matches_the_model(tmp_path):
+    PatternIO.save_binary(random_map(50, 130, 0.3, seed=0), str(tmp_path / 'pattern.npy'))
+    expected, _ = run_headless(tmp_path, 'model')
+    packed, stats = run_headless(tmp_path, 'packed', '--packed')
+    assert np.array_equal(packed, expected)
+    assert stats['history_states'] == stats['step'] + 1
+    packed, stats = run_headless(tmp_path, 'no_history', '--packed', '--no-history')
+    assert np.array_equal(packed, expected)
+    assert stats['history_states'] == 1 and stats['history_bytes'] == 0
@@ -0,0 +1,42 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import numpy as np
+
+import PatternIO
+from SandModel import SandModel, random_map
+
+
+def test_binary_pattern_is_copied_once(tmp_path):
+    grid = random_map(40, 50, 0.5, seed=0)
+    path = str(tmp_path / 'pattern.npy')
+    PatternIO.save_binary(grid, path)
+    mapped = PatternIO.load(path)
+    assert isinstance(mapped, np.memmap) and not mapped.flags.writeable
+    model = SandModel(pattern=None)
+    assert model.read_from_file(path)
+    assert np.array_equal(model.map, grid) and model.map.flags.writeable
+    assert not isinstance(model.map, np.memmap)
+    model.next()
+    assert np.array_equal(PatternIO.load(path), grid)
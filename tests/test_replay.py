@@ -0,0 +1,50 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import numpy as np
+
+from Replay import Replayer
+from SandModel import SandModel, random_map
+
+
+def test_advance_reaches_the_state_of_run():
+    model = SandModel(pattern=None)
+    model.load_map(random_map(30, 40, 0.3, seed=0), 'random')
+    for _ in range(10):
+        model.next()
+    model.begin_stroke(0, radius=1)
+    model.stroke_to(20, 5)
+    model.stroke_to(20, 30)
+    model.end_stroke()
+    for _ in range(15):
+        model.next()
+    log = model.input_log
+    log.end_step = model.steps
+    expected = Replayer(log).run()
+    replayer = Replayer(log)
+    advances = 1
+    while not replayer.advance(4):
+        advances += 1
+    assert np.array_equal(replayer.model.map, expected) and np.array_equal(expected, model.map)
+    assert advances > 1
@@ -0,0 +1,55 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import numpy as np
+import pytest
+
+from Materials import GRAVEL, WATER
+from SandEngine import SAND
+from SandModel import SandModel, random_map
+
+
+def mixed_map(seed, water):
+    grid = random_map(24, 20, 0.6, seed=seed)
+    rng = np.random.default_rng(seed)
+    grid[(grid == SAND) & (rng.random(grid.shape) < 0.3)] = GRAVEL.value
+    if water:
+        grid[(grid == SAND) & (rng.random(grid.shape) < 0.3)] = WATER.value
+    return grid
+
+
+@pytest.mark.parametrize('water', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_settle_matches_stepping(seed, water):
+    # the stepped model ends when nothing moves or, with flowing water, when a state repeats
+    stepped = SandModel(engine='materials', pattern=None)
+    stepped.load_map(mixed_map(seed, water), 'mixed')
+    while not stepped.finished:
+        stepped.next()
+    settled = SandModel(pattern=None)
+    settled.load_map(mixed_map(seed, water), 'mixed')
+    assert settled.settle() == stepped.steps
+    assert settled.finished and settled.cycle_period == stepped.cycle_period
+    assert np.array_equal(settled.map, stepped.map)
+    assert np.array_equal(settled.get_state(), settled.map)
@@ -0,0 +1,54 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import numpy as np
+import pytest
+
+from SandEngine import SAND, EMPTY
+from SandModel import SandModel
+
+
+@pytest.mark.parametrize('engine', ['vectorized', 'sparse', 'materials'])
+def test_stroke_reaches_history(engine):
+    model = SandModel(engine=engine, pattern=None)
+    model.load_map(np.full((30, 30), EMPTY, dtype=np.uint8), 'empty')
+    model.begin_stroke(SAND, radius=2)
+    model.stroke_to(5, 5)
+    model.stroke_to(5, 20)
+    assert np.array_equal(model.get_state(), model.map)
+    shown = [np.copy(model.map)]
+    for row in (10, 15, 20):
+        model.next()
+        shown.append(np.copy(model.get_state()))
+        model.stroke_to(row, 20)
+    model.end_stroke()
+    shown.append(np.copy(model.get_state()))
+    for _ in range(3):
+        model.next()
+        shown.append(np.copy(model.get_state()))
+    assert np.array_equal(shown[-1], model.map)
+    # the states recorded after the steps are rebuilt from the history
+    for expected in reversed(shown[1:]):
+        assert np.array_equal(model.get_state(), expected)
+        model.prev()
@@ -0,0 +1,47 @@
+##
+## MIT License
+##
+## Copyright (c) 2022 Żywko Szymon
+##
+## Permission is hereby granted, free of charge, to any person obtaining a copy
+## of this software and associated documentation files (the "Software"), to deal
+## in the Software without restriction, including without limitation the rights
+## to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+## copies of the Software, and to permit persons to whom the Software is
+## furnished to do so, subject to the following conditions:
+##
+## The above copyright notice and this permission notice shall be included in all
+## copies or substantial portions of the Software.
+##
+## THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+## IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+## FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+## AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+## LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+## OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+## SOFTWARE.
+##
+
+import csv
+
+import pytest
+
+import sweep
+
+
+@pytest.mark.parametrize('engine', ['auto', 'scalar'])
+def test_run_config_counts_moved_grains(engine):
+    config = {'pattern': 'small_bowl', 'generator': 'top', 'scale': 1, 'density': 1.0, 'seed': 0}
+    row = sweep.run_config(config, engine)
+    assert row['error'] == '' and row['settled']
+    assert row['grains_moved'] == 1425
+
+
+def test_resumed_report_keeps_one_row_per_configuration(tmp_path):
+    output = str(tmp_path / 'report.csv')
+    argv = ['--patterns', 'small_bowl', 'missing', '--generators', 'top', '--workers', '1', '--output', output]
+    for _ in range(2):
+        assert sweep.main(argv) == 0
+        with open(output, newline='') as file:
+            rows = list(csv.DictReader(file))
+        assert sorted(row['pattern'] for row in rows) == ['missing', 'small_bowl']